@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class LocalArtifactStore:
+    # Keep quote artifacts as files under one directory.
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        # Resolve an artifact name to a file path inside the store.
+        return os.path.join(self.root, os.path.basename(name))
+
+    def get(self, name):
+        # Return the artifact bytes, or None if missing.
+        try:
+            with open(self.path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name, data):
+        # Write an artifact atomically.
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def exists(self, name):
+        # Check whether an artifact is stored.
+        return os.path.exists(self.path(name))
+
+    def delete(self, name):
+        # Remove an artifact if present.
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+class MemoryArtifactStore:
+    # Keep quote artifacts in a size-bounded in-memory LRU.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        # Return the artifact bytes, or None if missing or evicted.
+        with self.lock:
+            data = self.items.get(name)
+            if data is not None:
+                self.items.move_to_end(name)
+            return data
+
+    def put(self, name, data):
+        # Store an artifact, evicting the least recently used ones to fit.
+        data = bytes(data)
+        with self.lock:
+            old = self.items.pop(name, None)
+            if old is not None:
+                self.size -= len(old)
+            self.items[name] = data
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self.items) > 1:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def exists(self, name):
+        # Check whether an artifact is stored.
+        with self.lock:
+            return name in self.items
+
+    def delete(self, name):
+        # Remove an artifact if present.
+        with self.lock:
+            old = self.items.pop(name, None)
+            if old is not None:
+                self.size -= len(old)
+
+
+_STORES_LOCK = threading.Lock()
+_STORES = {}
+
+
+def artifact_store(output_dir):
+    # Return the shared store picked by ARTIFACT_STORE (local or memory).
+    backend = os.environ.get("ARTIFACT_STORE", "local").strip().lower() or "local"
+    if backend not in ("local", "memory"):
+        raise ValueError("ARTIFACT_STORE must be 'local' or 'memory'")
+    key = (backend, output_dir)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            if backend == "memory":
+                try:
+                    max_mb = float(os.environ.get("ARTIFACT_CACHE_MB", "") or 64)
+                except ValueError:
+                    raise ValueError("ARTIFACT_CACHE_MB must be a number")
+                store = MemoryArtifactStore(int(max_mb * 1024 * 1024))
+            else:
+                store = LocalArtifactStore(output_dir)
+            _STORES[key] = store
+        return store
@@ -0,0 +1,255 @@
+"""Replay scripted quote conversations against /api/chat with N concurrent users.
+
+Each simulated user runs multi-turn conversations the way the chat page does,
+resending the growing history every turn. The report gives throughput, latency
+percentiles per turn and overall, and error rates. With --spawn it starts the
+Mistral stub and the app itself on a scratch output dir and a copy of the
+materials DB, so the run needs no API key or network:
+
+    python benchmarks/chat_load.py --spawn --users 20 --conversations 5
+    python benchmarks/chat_load.py --app-url http://127.0.0.1:8080 --users 50 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each turn is (label, user message). Wording avoids "price", "cost" and "how much",
+# which the chat route answers locally without calling the LLM.
+CONVERSATIONS = (
+    (
+        ("greeting", "Hi there, I'd like to order 24 cupcakes for an office party."),
+        ("due_date", "2030-06-01"),
+        ("details", "Yes. My name is Sam Baker from Crumb Co, contact sam@example.com, GBP please, VAT 20%."),
+        ("confirm", "That looks good, please confirm the quote."),
+    ),
+    (
+        ("greeting", "Hello! Could you quote 2 cake and 30 cupcakes for a wedding?"),
+        ("due_date", "2030-09-12"),
+        ("details", "Correct. My name is Ada Lovelace from Engine Works, contact ada@example.org, EUR, VAT 20%."),
+        ("confirm", "Great, confirm it please."),
+    ),
+    (
+        ("greeting", "Good morning, we need 12 pastry_box for a conference."),
+        ("due_date", "2030-03-20"),
+        ("details", "Yes that's right. My name is Lee Chen from Foo Ltd, contact lee@example.net, USD, VAT 15%."),
+        ("confirm", "Please confirm and generate it."),
+    ),
+)
+
+
+def percentile(samples, pct):
+    # Nearest-rank percentile of a sorted list.
+    if not samples:
+        return None
+    return samples[max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples))) - 1))]
+
+
+def summarize(latencies):
+    # Latency stats in milliseconds for one group of turns.
+    samples = sorted(latencies)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 1),
+        "p90_ms": round(percentile(samples, 90) * 1000, 1),
+        "p99_ms": round(percentile(samples, 99) * 1000, 1),
+        "max_ms": round(samples[-1] * 1000, 1),
+    }
+
+
+async def run_user(client, user_index, conversations, deadline, stats):
+    # One simulated customer working through conversations back to back.
+    done = 0
+    while (conversations is None or done < conversations) and (deadline is None or time.perf_counter() < deadline):
+        script = CONVERSATIONS[(user_index + done) % len(CONVERSATIONS)]
+        history = []
+        session_id = f"load-{user_index}-{uuid.uuid4().hex[:8]}"
+        for label, text in script:
+            history.append({"role": "user", "content": text})
+            started = time.perf_counter()
+            try:
+                resp = await client.post("/api/chat", json={"messages": history, "session_id": session_id})
+                elapsed = time.perf_counter() - started
+                body = resp.json() if resp.status_code == 200 else {}
+            except (httpx.HTTPError, ValueError) as exc:
+                stats["errors"][type(exc).__name__] = stats["errors"].get(type(exc).__name__, 0) + 1
+                stats["failed_turns"] += 1
+                break
+            stats["latencies"].setdefault(label, []).append(elapsed)
+            stats["turns"] += 1
+            reply = str(body.get("reply", ""))
+            if resp.status_code != 200:
+                kind = f"http_{resp.status_code}"
+            elif reply.startswith("Error:") or reply.startswith("That didn't work"):
+                kind = "llm_error"
+            else:
+                kind = None
+            if kind:
+                stats["errors"][kind] = stats["errors"].get(kind, 0) + 1
+                stats["failed_turns"] += 1
+                break
+            if body.get("quote"):
+                stats["quotes"] += 1
+            history.append({"role": "assistant", "content": reply})
+        else:
+            stats["conversations"] += 1
+        done += 1
+
+
+async def drive(app_url, users, conversations, duration, timeout):
+    # Run every user concurrently and collect the raw samples.
+    stats = {"latencies": {}, "turns": 0, "failed_turns": 0, "conversations": 0, "quotes": 0, "errors": {}}
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    deadline = time.perf_counter() + duration if duration else None
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(client, i, conversations, deadline, stats) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    return stats, elapsed
+
+
+def report(stats, elapsed, users):
+    # Turn the raw samples into the printed summary.
+    all_latencies = [s for samples in stats["latencies"].values() for s in samples]
+    attempted = stats["turns"] + sum(v for k, v in stats["errors"].items() if not k.startswith(("http_", "llm_")))
+    return {
+        "users": users,
+        "elapsed_s": round(elapsed, 2),
+        "turns": stats["turns"],
+        "turns_per_sec": round(stats["turns"] / elapsed, 2) if elapsed else None,
+        "conversations_completed": stats["conversations"],
+        "quotes_generated": stats["quotes"],
+        "error_rate": round(stats["failed_turns"] / attempted, 4) if attempted else None,
+        "errors": stats["errors"],
+        "latency": {"all": summarize(all_latencies), **{k: summarize(v) for k, v in stats["latencies"].items()}},
+    }
+
+
+def wait_until_up(url, timeout=30):
+    # Poll a URL until the server behind it answers.
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn_servers(args):
+    # Start the Mistral stub and the app against it; returns (app_url, processes, scratch dir).
+    tmp_dir = tempfile.mkdtemp(prefix="chat-load-")
+    db_path = os.path.join(tmp_dir, "materials.sqlite")
+    shutil.copy(os.path.join(ROOT, "assets", "materials.sqlite"), db_path)
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env = {key: value for key, value in os.environ.items() if key not in ("SMTP_HOST", "RESEND_API_KEY", "SHEET_ID")}
+    env.update(
+        MISTRAL_BASE_URL=f"{stub_url}/v1",
+        MISTRAL_API_KEY="stub",
+        WORLD_TIME_API_URL=f"{stub_url}/api/timezone/Europe/London",
+        DATE_VALIDATION_API_URL=f"{stub_url}/api/v3/publicholidays/{{year}}/{{country}}",
+        MATERIALS_DB_PATH=db_path,
+        TEMPLATE_PATH=os.path.join(ROOT, "assets", "quote_template.md"),
+        OUTPUT_DIR=os.path.join(tmp_dir, "out"),
+        FX_RATES_JSON=json.dumps({"GBP": 1.0, "USD": 1.27, "EUR": 1.17}),
+    )
+    stub_cmd = [
+        sys.executable,
+        os.path.join(ROOT, "benchmarks", "mistral_stub.py"),
+        "--port",
+        str(args.stub_port),
+        "--latency-ms",
+        str(args.stub_latency_ms),
+        "--jitter-ms",
+        str(args.stub_jitter_ms),
+        "--error-rate",
+        str(args.stub_error_rate),
+    ]
+    app_cmd = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "ui:app",
+        "--app-dir",
+        ROOT,
+        "--port",
+        str(args.app_port),
+        "--workers",
+        str(args.app_workers),
+        "--log-level",
+        "warning",
+    ]
+    # The app runs from the scratch dir so a developer's .env cannot redirect it to the real API;
+    # server output goes to stderr to keep the JSON report on stdout clean.
+    processes = [
+        subprocess.Popen(stub_cmd, env=env, stdout=sys.stderr),
+        subprocess.Popen(app_cmd, env=env, cwd=tmp_dir, stdout=sys.stderr),
+    ]
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    try:
+        wait_until_up(f"{stub_url}/health")
+        wait_until_up(f"{app_url}/")
+    except RuntimeError:
+        stop_servers(processes, tmp_dir)
+        raise
+    return app_url, processes, tmp_dir
+
+
+def stop_servers(processes, tmp_dir):
+    # Shut the spawned servers down and drop the scratch dir.
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--conversations", type=int, default=3, help="conversations per user")
+    parser.add_argument("--duration", type=float, default=None, help="run for this many seconds instead")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--spawn", action="store_true", help="start the stub and the app locally")
+    parser.add_argument("--app-port", type=int, default=8181)
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--stub-port", type=int, default=8190)
+    parser.add_argument("--stub-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    processes, tmp_dir = [], None
+    app_url = args.app_url
+    if args.spawn:
+        app_url, processes, tmp_dir = spawn_servers(args)
+    try:
+        conversations = None if args.duration else args.conversations
+        stats, elapsed = asyncio.run(drive(app_url, args.users, conversations, args.duration, args.timeout))
+    finally:
+        if processes:
+            stop_servers(processes, tmp_dir)
+    print(json.dumps(report(stats, elapsed, args.users), indent=2))
+
+
+if __name__ == "__main__":
+    main()
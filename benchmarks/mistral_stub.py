@@ -0,0 +1,213 @@
+"""Local stand-in for the Mistral chat completions API, for load tests and offline runs.
+
+Speaks the /v1/chat/completions protocol mistral_chat uses, including
+tool_calls: it walks a quote conversation by asking for missing details,
+calling estimate_job once the order is known and generate_quote after the
+customer confirms. It also answers the date and holiday lookups the chat
+route makes, so nothing leaves the machine. Point the app at it with:
+
+    python benchmarks/mistral_stub.py --port 8090 --latency-ms 300
+    MISTRAL_BASE_URL=http://127.0.0.1:8090/v1 MISTRAL_API_KEY=stub \\
+    WORLD_TIME_API_URL=http://127.0.0.1:8090/api/timezone/Europe/London \\
+    DATE_VALIDATION_API_URL='http://127.0.0.1:8090/api/v3/publicholidays/{year}/{country}' \\
+    python -m uvicorn ui:app --port 8080
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+CURRENCIES = ("GBP", "USD", "EUR")
+DATE_PATTERN = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+EMAIL_PATTERN = re.compile(r"[^@\s,]+@[^@\s,]+\.[A-Za-z]+")
+NAME_PATTERN = re.compile(r"\b(?i:my name is) ([A-Z][a-z]+(?: [A-Z][a-z]+)?)")
+COMPANY_PATTERN = re.compile(r"\bfrom ([A-Z][\w&' ]*?)(?=[,.]|$)")
+VAT_PATTERN = re.compile(r"\bvat\D{0,4}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def estimate_tokens(value):
+    # Rough token count (about four characters per token), enough for usage accounting.
+    text = value if isinstance(value, str) else json.dumps(value)
+    return max(1, len(text) // 4)
+
+
+def job_types_from_prompt(messages):
+    # Read the valid job types out of the app's system prompt.
+    for message in messages:
+        if message.get("role") == "system":
+            match = re.search(r"Valid job types: ([^.]+)\.", message.get("content", ""))
+            if match:
+                return [name.strip() for name in match.group(1).split(",") if name.strip()]
+    return ["cupcakes", "cake", "pastry_box"]
+
+
+def order_details(messages):
+    # Pull the quote fields the customer has given so far out of their messages.
+    text = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+    items = []
+    for job_type in job_types_from_prompt(messages):
+        match = re.search(rf"(\d+)\s+(?:x\s+)?{re.escape(job_type)}", text, re.IGNORECASE)
+        if match:
+            items.append({"job_type": job_type, "quantity": int(match.group(1))})
+    details = {"items": items}
+    for key, pattern in (("due_date", DATE_PATTERN), ("customer_email", EMAIL_PATTERN)):
+        match = pattern.search(text)
+        if match:
+            details[key] = match.group(0)
+    for key, pattern in (("customer_name", NAME_PATTERN), ("company_name", COMPANY_PATTERN)):
+        match = pattern.search(text)
+        if match:
+            details[key] = match.group(1).strip()
+    currency = next((code for code in CURRENCIES if re.search(rf"\b{code}\b", text, re.IGNORECASE)), None)
+    if currency:
+        details["currency"] = currency
+    vat = VAT_PATTERN.search(text)
+    if vat:
+        details["vat_pct"] = float(vat.group(1))
+    return details
+
+
+def quote_arguments(details):
+    # generate_quote / estimate_job arguments, using items only for multi-product orders.
+    args = {key: value for key, value in details.items() if key != "items"}
+    if len(details["items"]) == 1:
+        args.update(details["items"][0])
+    else:
+        args["items"] = details["items"]
+    args.setdefault("currency", "GBP")
+    return args
+
+
+def tool_call(name, arguments):
+    # One entry of an assistant message's tool_calls list.
+    return {
+        "id": f"call_{uuid.uuid4().hex[:9]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+def follow_up_reply(messages):
+    # Answer after the app has run the tools the previous reply asked for.
+    for message in reversed(messages):
+        if message.get("role") != "tool":
+            break
+        try:
+            result = json.loads(message.get("content") or "{}")
+        except json.JSONDecodeError:
+            continue
+        if isinstance(result, dict) and result.get("quote_id"):
+            return f"Your quote {result['quote_id']} has been generated, total {result['total']} {result['currency']}."
+        if isinstance(result, dict) and result.get("summary"):
+            summary = result["summary"]
+            return f"The estimated total is {summary['total']}. Shall I confirm?"
+        if isinstance(result, dict) and result.get("error"):
+            return f"That didn't work: {result['error']}"
+    return "Done. Anything else?"
+
+
+def next_turn(messages, tools):
+    # The assistant message the scripted model sends back for this conversation state.
+    if messages and messages[-1].get("role") == "tool":
+        return {"role": "assistant", "content": follow_up_reply(messages)}
+    details = order_details(messages)
+    last_user = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+    tool_names = {tool["function"]["name"] for tool in tools or []}
+    if not details["items"]:
+        return {"role": "assistant", "content": "Happy to help! Which bakes would you like, and how many of each?"}
+    if "due_date" not in details:
+        return {"role": "assistant", "content": "Lovely. What due date should I use (YYYY-MM-DD)?"}
+    missing = [key for key in ("customer_name", "company_name", "customer_email") if key not in details]
+    if missing:
+        return {
+            "role": "assistant",
+            "content": "Who is the quote for? Please share your name, company, contact and preferred currency.",
+        }
+    if "confirm" in last_user.lower() and "generate_quote" in tool_names:
+        args = dict(quote_arguments(details), confirm=True, send_email=False)
+        args.setdefault("vat_pct", 20)
+        return {"role": "assistant", "content": "", "tool_calls": [tool_call("generate_quote", args)]}
+    if "estimate_job" in tool_names:
+        return {"role": "assistant", "content": "", "tool_calls": [tool_call("estimate_job", quote_arguments(details))]}
+    return {"role": "assistant", "content": "Thanks, I have everything I need."}
+
+
+def create_app(latency_ms, jitter_ms, error_rate, seed):
+    # Build the stub app with its latency and failure settings.
+    app = FastAPI(title="Mistral stub")
+    rng = random.Random(seed)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        if not request.headers.get("authorization", "").startswith("Bearer "):
+            return JSONResponse({"message": "Unauthorized"}, status_code=401)
+        payload = await request.json()
+        delay = max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if error_rate and rng.random() < error_rate:
+            return JSONResponse({"message": "Service unavailable (stub)"}, status_code=503)
+        messages = payload.get("messages") or []
+        message = next_turn(messages, payload.get("tools"))
+        prompt_tokens = estimate_tokens(messages) + (estimate_tokens(payload["tools"]) if payload.get("tools") else 0)
+        completion_tokens = estimate_tokens(message)
+        return {
+            "id": f"cmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "mistral-stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/api/timezone/{area}/{city}")
+    def timezone(area: str, city: str):
+        # WorldTimeAPI shape, answered from the local clock.
+        return {"timezone": f"{area}/{city}", "datetime": dt.datetime.now(dt.timezone.utc).isoformat()}
+
+    @app.get("/api/v3/publicholidays/{year}/{country}")
+    def public_holidays(year: int, country: str):
+        # Nager.Date shape; the chat route only checks that a list comes back.
+        return []
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="mean delay per completion")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="uniform +/- spread around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions answered with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
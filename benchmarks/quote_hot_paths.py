@@ -0,0 +1,346 @@
+"""Benchmark the quoting hot paths against a seeded fixture database.
+
+Covers BOM scaling, costing, template rendering, text and PDF output, the
+end-to-end build_quote and /api/chat with the LLM stubbed out. Each case
+records ops/sec, p50/p99 latency and peak traced memory. Run from the repo root:
+
+    python benchmarks/quote_hot_paths.py                      # print results
+    python benchmarks/quote_hot_paths.py --save               # refresh benchmarks/baseline.json
+    python benchmarks/quote_hot_paths.py --compare            # flag regressions against it
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import pricing  # noqa: E402
+import ui  # noqa: E402
+import ui_routes_chat  # noqa: E402
+from artifact_store import artifact_store  # noqa: E402
+from bom import BOM_PER_UNIT  # noqa: E402
+from http_client import close_http_clients  # noqa: E402
+from quote_jobs import shutdown_pdf_pool  # noqa: E402
+from recipes import product_bom  # noqa: E402
+from sqlite_pool import close_db_connections  # noqa: E402
+
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+FIXTURE_SCHEMA = """
+CREATE TABLE materials (
+  id INTEGER PRIMARY KEY,
+  name TEXT UNIQUE NOT NULL,
+  unit TEXT NOT NULL,
+  unit_cost REAL NOT NULL,
+  currency TEXT NOT NULL,
+  last_updated TEXT NOT NULL
+);
+"""
+
+# Units the fixture may stock a BOM material in, so unit conversion stays on the measured path.
+STOCK_UNITS = {
+    "kg": ("kg", "g", "sack_25kg"),
+    "L": ("L", "ml"),
+    "ml": ("ml", "L"),
+    "each": ("each", "tray_30"),
+}
+
+FIXTURE_FX_RATES = {"GBP": 1.0, "USD": 1.27, "EUR": 1.17}
+
+JOB_TYPES = tuple(BOM_PER_UNIT)
+
+CASES = (
+    "product_bom",
+    "compute_costs",
+    "render_template",
+    "markdown_to_text",
+    "render_pdf_bytes",
+    "build_quote",
+    "chat_api",
+)
+
+# Environment keys that could make a benchmark run send mail or write to a real sheet.
+INTEGRATION_KEYS = ("RESEND_API_KEY", "SMTP_HOST", "SHEET_ID", "FX_LIVE")
+
+
+def seed_fixture_db(db_path, seed, extra_materials):
+    # Write a deterministic materials table: every BOM material plus filler rows.
+    rng = random.Random(seed)
+    rows = []
+    seen = set()
+    for recipe in BOM_PER_UNIT.values():
+        for material in recipe["materials"]:
+            if material["name"] in seen:
+                continue
+            seen.add(material["name"])
+            unit = rng.choice(STOCK_UNITS.get(material["unit"], (material["unit"],)))
+            currency = "USD" if rng.random() < 0.25 else "GBP"
+            rows.append((material["name"], unit, round(rng.uniform(0.05, 9.0), 2), currency))
+    for i in range(extra_materials):
+        unit = rng.choice(("kg", "g", "L", "ml", "each"))
+        rows.append((f"fixture_{i:05d}", unit, round(rng.uniform(0.01, 50.0), 2), rng.choice(("GBP", "USD", "EUR"))))
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(FIXTURE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO materials (name, unit, unit_cost, currency, last_updated) VALUES (?, ?, ?, ?, '2025-01-01')",
+            rows,
+        )
+    return len(rows)
+
+
+def prepare_environment(seed, extra_materials):
+    # Point the app at a scratch output dir and the fixture DB, with integrations switched off.
+    tmp_dir = tempfile.mkdtemp(prefix="quote-bench-")
+    db_path = os.path.join(tmp_dir, "materials.sqlite")
+    seed_fixture_db(db_path, seed, extra_materials)
+    # Drop whatever a local .env contributed before applying the fixture settings.
+    pricing.load_dotenv(os.devnull)
+    for key in INTEGRATION_KEYS:
+        os.environ.pop(key, None)
+    os.environ.update(
+        MATERIALS_DB_PATH=db_path,
+        OUTPUT_DIR=os.path.join(tmp_dir, "out"),
+        TEMPLATE_PATH=os.path.join(ROOT, "assets", "quote_template.md"),
+        SHEETS_SPOOL_PATH=os.path.join(tmp_dir, "sheet_spool.jsonl"),
+        FX_RATES_JSON=json.dumps(FIXTURE_FX_RATES),
+        MISTRAL_API_KEY="benchmark",
+    )
+    pricing.reload_config(os.devnull)
+    return tmp_dir
+
+
+def quote_inputs(rng, quantity=None):
+    # One randomized but reproducible quote request.
+    return {
+        "job_type": rng.choice(JOB_TYPES),
+        "quantity": quantity or rng.randint(1, 500),
+        "due_date": "2030-01-31",
+        "company_name": "Fixture Bakery",
+        "customer_name": "Bench Customer",
+        "customer_email": "bench@example.com",
+        "currency": rng.choice(("GBP", "USD", "EUR")),
+        "labor_rate": 15.0,
+        "markup_pct": 0.3,
+        "vat_pct": 0.2,
+        "notes": "Benchmark order.",
+    }
+
+
+def build_cases(seed):
+    # Map each case name to a zero-argument callable; setup work happens here, outside the timings.
+    defaults = pricing.get_defaults()
+    rng = random.Random(seed)
+    inputs_pool = [quote_inputs(rng) for _ in range(256)]
+    scale_pool = [(rng.choice(JOB_TYPES), rng.randint(1, 10000)) for _ in range(1024)]
+    store = artifact_store(defaults["output_dir"])
+    sample = pricing.build_quote(quote_inputs(random.Random(seed), quantity=24), defaults, store=store)
+    record = pricing.load_quote_record(store, sample["quote_id"])
+    data, lines = record["data"], record["data"]["lines"]
+    with open(defaults["template_path"], "r", encoding="utf-8") as f:
+        template_text = f.read()
+    markdown = sample["markdown"]
+
+    def cycle(pool):
+        position = [0]
+
+        def next_item():
+            position[0] = (position[0] + 1) % len(pool)
+            return pool[position[0]]
+
+        return next_item
+
+    next_scale = cycle(scale_pool)
+    next_inputs = cycle(inputs_pool)
+
+    def run_product_bom():
+        job_type, quantity = next_scale()
+        product_bom(defaults["materials_db_path"], job_type).scale(quantity)
+
+    def run_compute_costs():
+        pricing.compute_costs(dict(next_inputs()), defaults)
+
+    def run_render_template():
+        pricing.render_template(template_text, data)
+
+    def run_markdown_to_text():
+        pricing.markdown_to_text(markdown)
+
+    def run_render_pdf_bytes():
+        pricing.render_pdf_bytes(data, lines)
+
+    def run_build_quote():
+        pricing.build_quote(dict(next_inputs()), defaults, store=store)
+
+    return {
+        "product_bom": run_product_bom,
+        "compute_costs": run_compute_costs,
+        "render_template": run_render_template,
+        "markdown_to_text": run_markdown_to_text,
+        "render_pdf_bytes": run_render_pdf_bytes,
+        "build_quote": run_build_quote,
+        "chat_api": chat_api_case(seed),
+    }
+
+
+def chat_api_case(seed):
+    # POST a confirmed generate_quote turn to /api/chat with mistral_chat replaced by a canned reply.
+    rng = random.Random(seed)
+    counter = iter(range(1, 1 << 62))
+
+    async def stub_mistral_chat(messages, tools=None, tool_choice=None):
+        if not tools:
+            return {"choices": [{"message": {"role": "assistant", "content": "Your quote is ready."}}]}
+        # A fresh quantity per call keeps the quote memo from short-circuiting the pricing work.
+        args = dict(quote_inputs(rng, quantity=next(counter)), confirm=True, send_email=False, vat_pct=20)
+        call = {"id": "bench", "type": "function", "function": {"name": "generate_quote", "arguments": json.dumps(args)}}
+        return {"choices": [{"message": {"role": "assistant", "content": "", "tool_calls": [call]}}]}
+
+    ui_routes_chat.mistral_chat = stub_mistral_chat
+    client = TestClient(ui.app)
+    payload = {"messages": [{"role": "user", "content": "Yes, please confirm the quote."}]}
+
+    def run_chat_api():
+        response = client.post("/api/chat", json=payload)
+        if response.status_code != 200 or "quote" not in response.json():
+            raise RuntimeError(f"chat_api returned {response.status_code}: {response.text[:200]}")
+
+    return run_chat_api
+
+
+def measure(fn, seconds, min_iterations, memory_iterations):
+    # Time individual calls for at least `seconds`, then trace peak memory over a shorter run.
+    for _ in range(min(50, min_iterations)):
+        fn()
+    gc.collect()
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < min_iterations or time.perf_counter() < deadline:
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    samples.sort()
+    return {
+        "iterations": len(samples),
+        "ops_per_sec": round(len(samples) / sum(samples), 1),
+        "p50_us": round(statistics.median(samples) * 1e6, 2),
+        "p99_us": round(samples[max(0, int(len(samples) * 0.99) - 1)] * 1e6, 2),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold, p99_threshold):
+    # Return one line per case and whether any case regressed beyond the thresholds.
+    report = []
+    regressed = False
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            report.append(f"{name:<18} new case, no baseline")
+            continue
+        problems = []
+        if current["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            problems.append("ops/sec")
+        # Tail latency is noisier than throughput, so it gets its own, looser threshold.
+        if current["p99_us"] > base["p99_us"] * (1 + p99_threshold):
+            problems.append("p99")
+        # Small absolute changes in traced memory are noise, not regressions.
+        if current["peak_kb"] > base["peak_kb"] * (1 + threshold) and current["peak_kb"] - base["peak_kb"] > 64:
+            problems.append("peak memory")
+        regressed = regressed or bool(problems)
+        report.append(
+            f"{name:<18}"
+            f" ops/sec {base['ops_per_sec']:>10.1f} -> {current['ops_per_sec']:<10.1f}"
+            f" p99 {base['p99_us']:>9.1f} -> {current['p99_us']:<9.1f}us"
+            f" peak {base['peak_kb']:>7.1f} -> {current['peak_kb']:<7.1f}KB "
+            + (f"REGRESSION ({', '.join(problems)})" if problems else "ok")
+        )
+    return report, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--materials", type=int, default=500, help="filler rows in the fixture catalog")
+    parser.add_argument("--seconds", type=float, default=1.0, help="timed seconds per case")
+    parser.add_argument("--min-iterations", type=int, default=200)
+    parser.add_argument("--memory-iterations", type=int, default=50)
+    parser.add_argument("--only", action="append", help="run just this case (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative ops/sec and memory change")
+    parser.add_argument("--p99-threshold", type=float, default=1.0, help="allowed relative p99 increase")
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.only or ()) - set(CASES))
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}; choose from {', '.join(CASES)}")
+
+    # App log lines go to stderr so stdout stays valid JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        tmp_dir = prepare_environment(args.seed, args.materials)
+        try:
+            cases = build_cases(args.seed)
+            results = {
+                name: measure(cases[name], args.seconds, args.min_iterations, args.memory_iterations)
+                for name in CASES
+                if not args.only or name in args.only
+            }
+        finally:
+            shutdown_pdf_pool()
+            close_http_clients()
+            close_db_connections()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    document = {
+        "meta": {
+            "recorded_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "fixture_materials": args.materials,
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        report, regressed = compare(results, baseline, args.threshold, args.p99_threshold)
+        print("\n".join(report))
+        if regressed:
+            sys.exit(1)
+        return
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+            f.write("\n")
+    print(json.dumps(document, indent=2))
+
+
+if __name__ == "__main__":
+    main()
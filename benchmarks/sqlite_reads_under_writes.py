@@ -0,0 +1,128 @@
+"""Measure material reads while an admin writer updates prices in bursts.
+
+Compares the old access pattern (a fresh connection per call, rollback journal)
+with the pooled WAL connections from sqlite_pool. Run from the repo root:
+
+    python benchmarks/sqlite_reads_under_writes.py --seconds 5 --readers 4
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_pool import close_db_connections, db_connection  # noqa: E402
+
+
+READ_SQL = "SELECT name, unit, unit_cost, currency FROM materials ORDER BY name"
+WRITE_SQL = "UPDATE materials SET unit_cost = ? WHERE name = ?"
+
+
+def legacy_read(db_path):
+    # One connection per call, as the helpers did before pooling.
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(READ_SQL).fetchall()
+
+
+def legacy_write(db_path, name, cost):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(WRITE_SQL, (cost, name))
+        conn.commit()
+
+
+def pooled_read(db_path):
+    return db_connection(db_path).execute(READ_SQL).fetchall()
+
+
+def pooled_write(db_path, name, cost):
+    conn = db_connection(db_path)
+    with conn:
+        conn.execute(WRITE_SQL, (cost, name))
+
+
+def prepare_db(source, mode):
+    # Copy the materials DB so the benchmark never touches the real one.
+    tmp_dir = tempfile.mkdtemp(prefix="sqlite-bench-")
+    db_path = os.path.join(tmp_dir, "materials.sqlite")
+    shutil.copy(source, db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"PRAGMA journal_mode={'WAL' if mode == 'pooled' else 'DELETE'}")
+    return tmp_dir, db_path
+
+
+def run(mode, source, seconds, readers, burst, pause):
+    read, write = (pooled_read, pooled_write) if mode == "pooled" else (legacy_read, legacy_write)
+    tmp_dir, db_path = prepare_db(source, mode)
+    names = [row[0] for row in legacy_read(db_path)]
+    stop = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    errors = [0] * readers
+    writes = [0]
+
+    def reader(index):
+        samples = latencies[index]
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                read(db_path)
+            except sqlite3.OperationalError:
+                errors[index] += 1
+                continue
+            samples.append(time.perf_counter() - started)
+
+    def writer():
+        cost = 1.0
+        while not stop.is_set():
+            for i in range(burst):
+                cost += 0.01
+                write(db_path, names[i % len(names)], round(cost, 2))
+                writes[0] += 1
+            stop.wait(pause)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    close_db_connections()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    samples = sorted(s for per_reader in latencies for s in per_reader)
+    return {
+        "mode": mode,
+        "reads_per_sec": round(len(samples) / seconds, 1),
+        "writes_per_sec": round(writes[0] / seconds, 1),
+        "read_p50_ms": round(statistics.median(samples) * 1000, 3) if samples else None,
+        "read_p99_ms": round(samples[int(len(samples) * 0.99) - 1] * 1000, 3) if samples else None,
+        "read_max_ms": round(samples[-1] * 1000, 3) if samples else None,
+        "read_errors": sum(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.path.join("assets", "materials.sqlite"))
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=200, help="updates per admin write burst")
+    parser.add_argument("--pause", type=float, default=0.2, help="seconds between bursts")
+    args = parser.parse_args()
+    results = [
+        run(mode, args.db, args.seconds, args.readers, args.burst, args.pause) for mode in ("legacy", "pooled")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
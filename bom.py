@@ -1,6 +1,10 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
+from metrics import record_cache
 
+
+# Built-in recipes, used only to seed the recipe tables of a fresh database
+# (see recipes.ensure_recipes); pricing reads recipes.product_bom.
 BOM_PER_UNIT: Dict[str, Dict[str, object]] = {
     "cupcakes": {
         "materials": [
@@ -42,32 +46,52 @@ BOM_PER_UNIT: Dict[str, Dict[str, object]] = {
 }
 
 
-def list_job_types() -> List[str]:
-    return list(BOM_PER_UNIT.keys())
+MAX_SCALED_CACHE = 256
+
+
+class CompiledBom:
+    # One job type's flattened recipe as parallel tuples, plus its memoized scalings.
+
+    __slots__ = ("job_type", "names", "units", "qty_per_unit", "precision", "labor_hours", "scaled_cache")
+
+    def __init__(self, job_type: str, materials: List[Dict[str, object]], labor_hours: float) -> None:
+        self.job_type = job_type
+        self.names = tuple(m["name"] for m in materials)
+        self.units = tuple(m["unit"] for m in materials)
+        self.qty_per_unit = tuple(m["qty"] for m in materials)
+        self.precision = tuple(qty_precision(m["unit"]) for m in materials)
+        self.labor_hours = labor_hours
+        self.scaled_cache: Dict[int, Tuple[Tuple[float, ...], float]] = {}
+
+    def scale(self, quantity: int) -> Tuple[Tuple[float, ...], float]:
+        # Scaled, rounded material quantities and labor hours for a quantity, memoized.
+        scaled = self.scaled_cache.get(quantity)
+        record_cache("bom_scaled", scaled is not None)
+        if scaled is not None:
+            return scaled
+        if quantity <= 0:
+            raise ValueError("quantity must be > 0")
+        qtys = tuple(round(qty * quantity, digits) for qty, digits in zip(self.qty_per_unit, self.precision))
+        scaled = (qtys, round(self.labor_hours * quantity, 3))
+        if len(self.scaled_cache) >= MAX_SCALED_CACHE:
+            self.scaled_cache.clear()
+        self.scaled_cache[quantity] = scaled
+        return scaled
+
+    def as_estimate(self, quantity: int) -> Dict[str, object]:
+        # The scaled recipe as a job_type / quantity / materials / labor_hours dict.
+        qtys, labor = self.scale(quantity)
+        return {
+            "job_type": self.job_type,
+            "quantity": quantity,
+            "materials": [
+                {"name": name, "unit": unit, "qty": qty} for name, unit, qty in zip(self.names, self.units, qtys)
+            ],
+            "labor_hours": labor,
+        }
 
 
-def scale_bom(job_type: str, quantity: int) -> Dict[str, object]:
-    if job_type not in BOM_PER_UNIT:
-        raise ValueError("Unknown job_type")
-    if quantity <= 0:
-        raise ValueError("quantity must be > 0")
-    per_unit = BOM_PER_UNIT[job_type]
-    scaled_materials = []
-    for material in per_unit["materials"]:
-        scaled_qty = material["qty"] * quantity
-        if material["unit"] in ("kg", "L"):
-            scaled_qty = round(scaled_qty, 3)
-        elif material["unit"] == "ml":
-            scaled_qty = round(scaled_qty, 1)
-        else:
-            scaled_qty = round(scaled_qty, 1)
-        scaled_materials.append(
-            {"name": material["name"], "unit": material["unit"], "qty": scaled_qty}
-        )
-    labor = round(per_unit["labor_hours"] * quantity, 3)
-    return {
-        "job_type": job_type,
-        "quantity": quantity,
-        "materials": scaled_materials,
-        "labor_hours": labor,
-    }
+def qty_precision(unit: str) -> int:
+    if unit in ("kg", "L"):
+        return 3
+    return 1
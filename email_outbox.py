@@ -0,0 +1,351 @@
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+
+from artifact_store import artifact_store
+from metrics import timed_stage
+from pricing import (
+    DEFAULTS,
+    artifact_name,
+    build_quote_email,
+    env_int,
+    env_str,
+    get_defaults,
+    open_smtp_connection,
+    resend_settings,
+    send_quote_email_resend,
+    smtp_settings,
+)
+from quote_jobs import ensure_artifact
+
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY,
+  quote_id TEXT NOT NULL,
+  transport TEXT NOT NULL,
+  recipient TEXT NOT NULL,
+  subject TEXT NOT NULL,
+  body TEXT NOT NULL,
+  status TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at REAL NOT NULL,
+  claimed_at REAL,
+  attachment_formats TEXT,
+  last_error TEXT,
+  created_at REAL NOT NULL,
+  sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_quote ON outbox (quote_id);
+-- Attachments stored with the message by older versions; new messages list formats rendered at send time.
+CREATE TABLE IF NOT EXISTS outbox_attachments (
+  outbox_id INTEGER NOT NULL REFERENCES outbox (id),
+  filename TEXT NOT NULL,
+  data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_attachments_owner ON outbox_attachments (outbox_id);
+"""
+
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+SMTP_IDLE_SECONDS = 60
+CLAIM_LEASE_SECONDS = 300
+
+_STATE_LOCK = threading.Lock()
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_WORKERS = []
+_READY_PATHS = set()
+
+
+def outbox_path():
+    # Location of the outbox database (EMAIL_OUTBOX_PATH, default OUTPUT_DIR/outbox.sqlite).
+    default = os.path.join(env_str("OUTPUT_DIR", DEFAULTS["output_dir"]), "outbox.sqlite")
+    return env_str("EMAIL_OUTBOX_PATH", default)
+
+
+def outbox_connect():
+    # Open the outbox database, creating the tables on first use.
+    path = outbox_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if path not in _READY_PATHS:
+        conn.executescript(OUTBOX_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(outbox)")}
+        for column, column_type in (("claimed_at", "REAL"), ("attachment_formats", "TEXT")):
+            if column in columns:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {column_type}")
+                conn.commit()
+            except sqlite3.OperationalError:
+                # Another process added it first.
+                pass
+        with _STATE_LOCK:
+            _READY_PATHS.add(path)
+    return conn
+
+
+def enqueue_email(quote_id, recipient, subject, body, attachment_formats):
+    # Queue a quote email and return its outbox id, or None if no transport is configured.
+    # Attachments are rendered by the worker at send time, so queueing never waits on a render.
+    if resend_settings() is not None:
+        transport = "resend"
+    elif smtp_settings() is not None:
+        transport = "smtp"
+    else:
+        return None
+    now = time.time()
+    conn = outbox_connect()
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO outbox (quote_id, transport, recipient, subject, body, status, next_attempt_at, "
+                "attachment_formats, created_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (quote_id, transport, recipient, subject, body, now, ",".join(attachment_formats), now),
+            )
+            outbox_id = cursor.lastrowid
+    finally:
+        conn.close()
+    start_email_workers()
+    _WAKE.set()
+    return outbox_id
+
+
+def email_state(outbox_id):
+    # Return a message's delivery state: queued, sending, sent or "failed: <reason>".
+    conn = outbox_connect()
+    try:
+        row = conn.execute("SELECT status, last_error FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return "unknown"
+    if row["status"] == "failed":
+        return f"failed: {row['last_error']}"
+    return row["status"]
+
+
+def latest_email(quote_id):
+    # Return the latest outbox entry for a quote, or None.
+    if not os.path.exists(outbox_path()):
+        return None
+    conn = outbox_connect()
+    try:
+        row = conn.execute(
+            "SELECT id, status, attempts, last_error, created_at, sent_at FROM outbox "
+            "WHERE quote_id = ? ORDER BY id DESC LIMIT 1",
+            (quote_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def outbox_depth():
+    # Count messages still waiting to be sent; 0 when no outbox has been created.
+    if not os.path.exists(outbox_path()):
+        return 0
+    conn = outbox_connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def claim_next_email():
+    # Atomically mark the next due message as sending and return it with its attachments.
+    # Claims are leases: only 'sending' rows older than the lease (a worker died mid-send) are taken over.
+    now = time.time()
+    lease = env_int("EMAIL_CLAIM_LEASE_SECONDS", CLAIM_LEASE_SECONDS)
+    conn = outbox_connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM outbox WHERE (status = 'queued' AND next_attempt_at <= ?) "
+            "OR (status = 'sending' AND (claimed_at IS NULL OR claimed_at <= ?)) ORDER BY id LIMIT 1",
+            (now, now - lease),
+        ).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        conn.execute(
+            "UPDATE outbox SET status = 'sending', attempts = attempts + 1, claimed_at = ? WHERE id = ?",
+            (now, row["id"]),
+        )
+        attachments = conn.execute(
+            "SELECT filename, data FROM outbox_attachments WHERE outbox_id = ? ORDER BY rowid",
+            (row["id"],),
+        ).fetchall()
+        conn.commit()
+    finally:
+        conn.close()
+    message = dict(row)
+    message["attempts"] += 1
+    message["attachments"] = [(a["filename"], bytes(a["data"])) for a in attachments]
+    return message
+
+
+def finish_email(message, error=None):
+    # Record a send result: sent, retry later with backoff, or give up.
+    conn = outbox_connect()
+    try:
+        with conn:
+            if error is None:
+                conn.execute(
+                    "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                    (time.time(), message["id"]),
+                )
+                conn.execute("DELETE FROM outbox_attachments WHERE outbox_id = ?", (message["id"],))
+                return
+            detail = f"{error.__class__.__name__}: {error}"
+            if message["attempts"] >= env_int("EMAIL_MAX_ATTEMPTS", 5):
+                conn.execute(
+                    "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                    (detail, message["id"]),
+                )
+                return
+            delay = min(BACKOFF_BASE_SECONDS * 2 ** (message["attempts"] - 1), BACKOFF_MAX_SECONDS)
+            conn.execute(
+                "UPDATE outbox SET status = 'queued', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (time.time() + delay, detail, message["id"]),
+            )
+    finally:
+        conn.close()
+
+
+class SmtpSession:
+    # One worker's authenticated SMTP connection, reused across messages.
+
+    def __init__(self):
+        self.server = None
+        self.settings = None
+        self.last_used = 0.0
+
+    def send(self, settings, msg):
+        # Send over the cached connection, reconnecting once if it went stale.
+        if self.server is not None and (
+            settings != self.settings or time.time() - self.last_used > SMTP_IDLE_SECONDS
+        ):
+            self.close()
+        for attempt in (1, 2):
+            if self.server is None:
+                self.server = open_smtp_connection(settings)
+                self.settings = settings
+            try:
+                self.server.send_message(msg)
+                self.last_used = time.time()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        # Politely close the connection if one is open.
+        server, self.server = self.server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
+def render_attachments(message):
+    # Render the quote artifacts a message carries; a failed render fails the attempt so it is retried.
+    attachments = list(message["attachments"])
+    store = artifact_store(get_defaults()["output_dir"])
+    for fmt in filter(None, (message["attachment_formats"] or "").split(",")):
+        data = ensure_artifact(store, message["quote_id"], fmt)
+        if data is None:
+            raise ValueError(f"Quote {message['quote_id']} has no {fmt} to attach")
+        attachments.append((artifact_name(message["quote_id"], fmt), data))
+    return attachments
+
+
+def deliver(message, session):
+    # Send one outbox message over its transport.
+    attachments = render_attachments(message)
+    if message["transport"] == "resend":
+        settings = resend_settings()
+        if settings is None:
+            raise ValueError("Resend settings are missing or incomplete")
+        send_quote_email_resend(settings, message["recipient"], message["subject"], message["body"], attachments)
+        return
+    settings = smtp_settings()
+    msg = build_quote_email(settings, message["recipient"], message["subject"], message["body"], attachments)
+    with timed_stage("smtp_send"):
+        session.send(settings, msg)
+
+
+def email_worker():
+    # Drain the outbox until asked to stop, keeping an SMTP session open between sends.
+    session = SmtpSession()
+    try:
+        while not _STOP.is_set():
+            try:
+                message = claim_next_email()
+            except sqlite3.Error as exc:
+                print(f"[email] outbox unavailable: {exc!r}")
+                message = None
+            if message is None:
+                if session.server is not None and time.time() - session.last_used > SMTP_IDLE_SECONDS:
+                    session.close()
+                _WAKE.wait(1.0)
+                _WAKE.clear()
+                continue
+            try:
+                deliver(message, session)
+                error = None
+            except Exception as exc:
+                print(f"[email] send for {message['quote_id']} failed (attempt {message['attempts']}): {exc!r}")
+                error = exc
+            try:
+                finish_email(message, error)
+            except Exception as exc:
+                # The claim lease runs out and the message is retried; the worker itself must keep going.
+                print(f"[email] could not record the result for {message['quote_id']}: {exc!r}")
+    finally:
+        session.close()
+
+
+def start_email_workers():
+    # Start the outbox worker threads once per process, replacing any that have died.
+    with _STATE_LOCK:
+        _WORKERS[:] = [thread for thread in _WORKERS if thread.is_alive()]
+        wanted = max(1, env_int("EMAIL_WORKERS", 2))
+        if len(_WORKERS) >= wanted:
+            return
+        _STOP.clear()
+        running = {thread.name for thread in _WORKERS}
+        for index in range(wanted):
+            name = f"email-outbox-{index}"
+            if name in running:
+                continue
+            thread = threading.Thread(target=email_worker, name=name, daemon=True)
+            thread.start()
+            _WORKERS.append(thread)
+
+
+def stop_email_workers(timeout=10):
+    # Ask the workers to finish their current message and exit.
+    _STOP.set()
+    _WAKE.set()
+    with _STATE_LOCK:
+        workers = list(_WORKERS)
+        _WORKERS.clear()
+    for thread in workers:
+        thread.join(timeout)
+
+
+def resume_email_outbox():
+    # Restart workers at startup when an earlier process left mail in the outbox.
+    if resend_settings() is None and smtp_settings() is None:
+        return
+    if os.path.exists(outbox_path()) and outbox_depth():
+        start_email_workers()
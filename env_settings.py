@@ -0,0 +1,29 @@
+import os
+
+
+def env_float(name, default):
+    # Read a float from the env with a fallback.
+    val = os.environ.get(name, "").strip()
+    if val == "":
+        return default
+    try:
+        return float(val)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def env_int(name, default):
+    # Read an int from the env with a fallback.
+    val = os.environ.get(name, "").strip()
+    if val == "":
+        return default
+    try:
+        return int(val)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+def env_str(name, default):
+    # Read a string from the env with a fallback.
+    val = os.environ.get(name)
+    return default if val is None or val == "" else val
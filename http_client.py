@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+from env_settings import env_int
+
+
+USER_AGENT = "bakery-quote-agent"
+
+_CLIENTS_LOCK = threading.Lock()
+_CLIENTS = {}
+_ASYNC_CLIENTS = {}
+_RETIRING = set()
+
+
+def pool_limits(per_host=None):
+    # Connection limits for a pool; HTTP_POOL_PER_HOST unless the caller sizes it.
+    if per_host is None:
+        per_host = env_int("HTTP_POOL_PER_HOST", 10)
+    return httpx.Limits(
+        max_connections=per_host,
+        max_keepalive_connections=per_host,
+        keepalive_expiry=env_int("HTTP_KEEPALIVE_SECONDS", 30),
+    )
+
+
+def http_client(url):
+    # Return the shared keep-alive client for the URL's host, creating it on first use.
+    parts = urlsplit(url)
+    origin = (parts.scheme, parts.netloc)
+    client = _CLIENTS.get(origin)
+    if client is not None:
+        return client
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(origin)
+        if client is None:
+            client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                follow_redirects=True,
+                limits=pool_limits(),
+                timeout=httpx.Timeout(10.0),
+                headers={"User-Agent": USER_AGENT},
+            )
+            _CLIENTS[origin] = client
+        return client
+
+
+def http_request(method, url, timeout, **kwargs):
+    # Send a request over the pooled client for the URL's host.
+    return http_client(url).request(method, url, timeout=timeout, **kwargs)
+
+
+def http_get_json(url, timeout, **kwargs):
+    # GET a URL and decode its JSON body, raising on HTTP errors.
+    resp = http_request("GET", url, timeout, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def async_http_pool(url, name=None, max_connections=None):
+    # Return the named async pool for the URL's host on the running loop, as a dict holding its client.
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc, name)
+    loop = asyncio.get_running_loop()
+    pool = _ASYNC_CLIENTS.get(key)
+    if pool is not None and pool["loop"] is loop and pool["limit"] == max_connections:
+        return pool
+    with _CLIENTS_LOCK:
+        previous = _ASYNC_CLIENTS.get(key)
+        if previous is not None and previous["loop"] is loop and previous["limit"] == max_connections:
+            return previous
+        # Async connections belong to one loop, and pool limits are fixed at creation, so a pool made
+        # on another loop or with another limit is replaced, and closed once its requests finish.
+        client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True,
+            limits=pool_limits(max_connections),
+            timeout=httpx.Timeout(10.0),
+            headers={"User-Agent": USER_AGENT},
+        )
+        pool = {"loop": loop, "limit": max_connections, "client": client, "in_flight": 0, "retired": False}
+        _ASYNC_CLIENTS[key] = pool
+    if previous is not None:
+        retire_async_pool(previous)
+    return pool
+
+
+async def close_quietly(client):
+    # Close an async client, logging rather than raising if its connections are already gone.
+    try:
+        await client.aclose()
+    except Exception as exc:
+        print(f"[http] could not close a retired async client: {exc!r}")
+
+
+def retire_async_pool(pool):
+    # Mark a replaced pool retired and close it now if idle; otherwise its last request closes it.
+    pool["retired"] = True
+    if pool["in_flight"]:
+        return
+    if pool["loop"] is not asyncio.get_running_loop() and pool["loop"].is_running():
+        asyncio.run_coroutine_threadsafe(close_quietly(pool["client"]), pool["loop"])
+        return
+    task = asyncio.get_running_loop().create_task(close_quietly(pool["client"]))
+    _RETIRING.add(task)
+    task.add_done_callback(_RETIRING.discard)
+
+
+async def async_http_request(method, url, timeout, pool_timeout=None, pool=None, max_connections=None, **kwargs):
+    # Send a request over a pooled async client, cancelling it if the whole exchange outlasts its deadline.
+    # Waiting for a free connection is bounded by pool_timeout, on top of the timeout for the exchange itself.
+    if pool_timeout is None:
+        pool_timeout = timeout
+    entry = async_http_pool(url, pool, max_connections)
+    request = entry["client"].request(method, url, timeout=httpx.Timeout(timeout, pool=pool_timeout), **kwargs)
+    entry["in_flight"] += 1
+    try:
+        return await asyncio.wait_for(request, timeout + pool_timeout)
+    finally:
+        entry["in_flight"] -= 1
+        if entry["retired"] and not entry["in_flight"]:
+            retire_async_pool(entry)
+
+
+async def async_http_get_json(url, timeout, **kwargs):
+    # Async counterpart of http_get_json for code running on the event loop.
+    resp = await async_http_request("GET", url, timeout, **kwargs)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def close_http_clients():
+    # Close every pooled connection.
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        client.close()
+
+
+async def close_async_http_clients():
+    # Close every async pool, including pools retired earlier that are still closing.
+    loop = asyncio.get_running_loop()
+    with _CLIENTS_LOCK:
+        pools = list(_ASYNC_CLIENTS.values())
+        _ASYNC_CLIENTS.clear()
+    for pool in pools:
+        if pool["loop"] is loop:
+            await pool["client"].aclose()
+        else:
+            retire_async_pool(pool)
+    closing = [task for task in _RETIRING if task.get_loop() is loop]
+    if closing:
+        await asyncio.gather(*closing)
@@ -0,0 +1,198 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import describe, increment, observe, register_gauge
+from pricing import DEFAULTS, env_float, env_int, env_str
+
+
+MAX_TRACKED_SESSIONS = 1000
+
+describe("llm_call_seconds", "histogram", "Wall time of each LLM call by route, call and model.")
+describe("llm_calls_total", "counter", "LLM calls by route, call, model and outcome.")
+describe("llm_tokens_total", "counter", "Prompt and completion tokens reported by the LLM API.")
+describe("llm_tool_calls_total", "counter", "Tool calls requested by the LLM, by tool.")
+describe("llm_cost_total", "counter", "Estimated LLM spend from the configured per-million-token prices.")
+
+_TELEMETRY_LOCK = threading.Lock()
+_LOG_LOCK = threading.Lock()
+_LOG_QUEUE = queue.Queue()
+_LOG_STATE = {"thread": None}
+_SESSIONS = OrderedDict()
+_ROUTES = {}
+
+
+def empty_usage():
+    # Zeroed running totals for a session or route.
+    return {
+        "calls": 0,
+        "errors": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "tool_calls": 0,
+        "wall_seconds": 0.0,
+        "cost": 0.0,
+    }
+
+
+def llm_log_path():
+    # Location of the rolling call log (LLM_LOG_PATH, default OUTPUT_DIR/llm_calls.jsonl).
+    default = os.path.join(env_str("OUTPUT_DIR", DEFAULTS["output_dir"]), "llm_calls.jsonl")
+    return env_str("LLM_LOG_PATH", default)
+
+
+def call_cost(prompt_tokens, completion_tokens):
+    # Spend for one call from LLM_PROMPT_COST_PER_1M / LLM_COMPLETION_COST_PER_1M; 0 when unset.
+    prompt_rate = env_float("LLM_PROMPT_COST_PER_1M", 0.0)
+    completion_rate = env_float("LLM_COMPLETION_COST_PER_1M", 0.0)
+    return (prompt_tokens * prompt_rate + completion_tokens * completion_rate) / 1_000_000
+
+
+def append_call_log(path, line):
+    # Append one JSON line to the call log, rotating it past LLM_LOG_MAX_BYTES into .1, .2, ... files.
+    # Only the writer thread calls this, so the file needs no lock.
+    max_bytes = env_int("LLM_LOG_MAX_BYTES", 10 * 1024 * 1024)
+    backups = max(1, env_int("LLM_LOG_BACKUPS", 3))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    if size and size + len(line) > max_bytes:
+        for index in range(backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{index}"):
+                os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+        os.replace(path, f"{path}.1")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def llm_log_writer():
+    # Write queued call log lines until a None sentinel arrives.
+    while True:
+        item = _LOG_QUEUE.get()
+        if item is None:
+            return
+        try:
+            append_call_log(*item)
+        except OSError as exc:
+            print(f"[llm] could not write call log: {exc!r}")
+
+
+def start_llm_log_writer():
+    # Start the log writer thread once per process; _LOG_LOCK only guards the start, never the writes.
+    thread = _LOG_STATE["thread"]
+    if thread is not None and thread.is_alive():
+        return
+    with _LOG_LOCK:
+        thread = _LOG_STATE["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=llm_log_writer, name="llm-log-writer", daemon=True)
+        _LOG_STATE["thread"] = thread
+        thread.start()
+
+
+def stop_llm_log_writer(timeout=10):
+    # Write out whatever is queued and stop the writer thread.
+    with _LOG_LOCK:
+        thread, _LOG_STATE["thread"] = _LOG_STATE["thread"], None
+    if thread is not None:
+        _LOG_QUEUE.put(None)
+        thread.join(timeout)
+
+
+def queue_call_log(entry):
+    # Hand a call log entry to the writer thread, so the chat path never waits on disk.
+    _LOG_QUEUE.put((llm_log_path(), json.dumps(entry, default=str) + "\n"))
+    start_llm_log_writer()
+
+
+def add_usage(totals, entry):
+    # Fold one call into running totals.
+    totals["calls"] += 1
+    totals["errors"] += entry["outcome"] == "error"
+    totals["prompt_tokens"] += entry["prompt_tokens"]
+    totals["completion_tokens"] += entry["completion_tokens"]
+    totals["tool_calls"] += len(entry["tool_calls"])
+    totals["wall_seconds"] += entry["wall_seconds"]
+    totals["cost"] += entry["cost"]
+    totals["last_at"] = entry["at"]
+
+
+def record_llm_call(route, session_id, turn_id, call, model, response, wall_seconds, error=None):
+    # Record one LLM round trip in the metrics, the session/route totals and the JSONL log.
+    usage = (response or {}).get("usage") or {}
+    message = ((response or {}).get("choices") or [{}])[0].get("message") or {}
+    tool_calls = [(tool.get("function") or {}).get("name", "unknown") for tool in message.get("tool_calls") or []]
+    if error is not None:
+        outcome = "error"
+    elif tool_calls:
+        outcome = "tool_calls"
+    else:
+        outcome = "reply"
+    model = (response or {}).get("model") or model
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    entry = {
+        "at": time.time(),
+        "route": route,
+        "session_id": session_id,
+        "turn_id": turn_id,
+        "call": call,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "wall_seconds": round(wall_seconds, 6),
+        "tool_calls": tool_calls,
+        "outcome": outcome,
+        "cost": round(call_cost(prompt_tokens, completion_tokens), 8),
+    }
+    if error is not None:
+        entry["error"] = str(error)[:500]
+
+    observe("llm_call_seconds", wall_seconds, route=route, call=call, model=model)
+    increment("llm_calls_total", route=route, call=call, model=model, outcome=outcome)
+    if prompt_tokens:
+        increment("llm_tokens_total", prompt_tokens, route=route, model=model, kind="prompt")
+    if completion_tokens:
+        increment("llm_tokens_total", completion_tokens, route=route, model=model, kind="completion")
+    for tool in tool_calls:
+        increment("llm_tool_calls_total", route=route, tool=tool)
+    if entry["cost"]:
+        increment("llm_cost_total", entry["cost"], route=route, model=model)
+
+    with _TELEMETRY_LOCK:
+        add_usage(_ROUTES.setdefault(route, empty_usage()), entry)
+        session = _SESSIONS.pop(session_id, None) or empty_usage()
+        add_usage(session, entry)
+        _SESSIONS[session_id] = session
+        while len(_SESSIONS) > MAX_TRACKED_SESSIONS:
+            _SESSIONS.popitem(last=False)
+    queue_call_log(entry)
+    return entry
+
+
+def rounded_usage(totals):
+    # Copy of running totals with float noise trimmed for display.
+    return {**totals, "wall_seconds": round(totals["wall_seconds"], 6), "cost": round(totals["cost"], 8)}
+
+
+def llm_usage(limit=50):
+    # Per-route totals and the most recently active sessions, newest first.
+    with _TELEMETRY_LOCK:
+        routes = {route: rounded_usage(totals) for route, totals in _ROUTES.items()}
+        sessions = [{"session_id": key, **rounded_usage(totals)} for key, totals in reversed(_SESSIONS.items())]
+    return {"routes": routes, "sessions": sessions[:limit]}
+
+
+def tracked_sessions():
+    # Number of chat sessions with recorded LLM usage.
+    with _TELEMETRY_LOCK:
+        return len(_SESSIONS)
+
+
+register_gauge("llm_sessions_tracked", "Chat sessions with LLM usage held in memory.", tracked_sessions)
@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds, in seconds, shared by every latency histogram.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_METRICS_LOCK = threading.Lock()
+_DESCRIPTIONS = {
+    "http_request_duration_seconds": ("histogram", "Request latency per route template and method."),
+    "http_requests_total": ("counter", "Requests per route template, method and status code."),
+    "quote_stage_seconds": ("histogram", "Time spent in each stage of building and delivering a quote."),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit or miss)."),
+    "cache_hit_ratio": ("gauge", "Share of cache lookups served from cache since start."),
+}
+_HISTOGRAMS = {}
+_COUNTERS = {}
+_CACHE_COUNTS = {}
+_GAUGES = {}
+
+
+def describe(name, kind, help_text):
+    # Register the TYPE and HELP lines for a metric.
+    _DESCRIPTIONS[name] = (kind, help_text)
+
+
+def label_key(labels):
+    # Hashable, stably ordered form of a label dict.
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    # Add one observation to a histogram.
+    key = (name, label_key(labels))
+    index = bisect.bisect_left(LATENCY_BUCKETS, value)
+    with _METRICS_LOCK:
+        series = _HISTOGRAMS.get(key)
+        if series is None:
+            series = _HISTOGRAMS[key] = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+        series["buckets"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+
+def increment(name, amount=1, **labels):
+    # Add to a counter.
+    key = (name, label_key(labels))
+    with _METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + amount
+
+
+@contextmanager
+def timed_stage(stage):
+    # Time a block into quote_stage_seconds{stage=...}, including blocks that raise.
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("quote_stage_seconds", time.perf_counter() - started, stage=stage)
+
+
+def record_cache(cache, hit):
+    # Count one lookup against a cache; lock-free because it sits on the hottest paths.
+    key = (cache, hit)
+    # Concurrent increments can occasionally lose a count, which a hit ratio tolerates.
+    _CACHE_COUNTS[key] = _CACHE_COUNTS.get(key, 0) + 1
+
+
+def register_gauge(name, help_text, collect, label=None):
+    # Expose a value computed at scrape time; with a label, collect returns {label value: number}.
+    describe(name, "gauge", help_text)
+    with _METRICS_LOCK:
+        _GAUGES[name] = (collect, label)
+
+
+def escape_label(value):
+    # Escape a label value for the Prometheus text format.
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels, extra=()):
+    # Render {a="b",...}, or nothing when there are no labels.
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+
+def format_number(value):
+    # Prometheus float formatting, with integers kept short.
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+def cache_metrics(counts):
+    # cache_requests_total series and the hit ratio derived from them.
+    requests = []
+    totals = {}
+    for (cache, hit), value in counts.items():
+        requests.append(((("cache", cache), ("result", "hit" if hit else "miss")), value))
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (value if hit else 0), lookups + value)
+    ratios = [((("cache", cache),), hits / lookups) for cache, (hits, lookups) in totals.items() if lookups]
+    return requests, ratios
+
+
+def render_metrics():
+    # Every metric in the Prometheus text exposition format (version 0.0.4).
+    with _METRICS_LOCK:
+        histograms = {key: {**series, "buckets": list(series["buckets"])} for key, series in _HISTOGRAMS.items()}
+        counters = dict(_COUNTERS)
+        gauges = dict(_GAUGES)
+    families = {}
+    for (name, labels), series in histograms.items():
+        families.setdefault(name, []).append((labels, series))
+    for (name, labels), value in counters.items():
+        families.setdefault(name, []).append((labels, value))
+    requests, ratios = cache_metrics(dict(_CACHE_COUNTS))
+    if requests:
+        families["cache_requests_total"] = requests
+        families["cache_hit_ratio"] = ratios
+    for name, (collect, label) in gauges.items():
+        try:
+            value = collect()
+        except Exception as exc:
+            print(f"[metrics] gauge {name} failed: {exc!r}")
+            continue
+        if label is None:
+            families[name] = [((), value)]
+        else:
+            families[name] = [(((label, key),), v) for key, v in value.items()]
+
+    out = []
+    for name in sorted(families):
+        kind, help_text = _DESCRIPTIONS.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(families[name], key=lambda item: item[0]):
+            if kind != "histogram":
+                out.append(f"{name}{format_labels(labels)} {format_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), value["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else format_number(bound)
+                out.append(f"{name}_bucket{format_labels(labels, (('le', le),))} {cumulative}")
+            out.append(f"{name}_sum{format_labels(labels)} {format_number(value['sum'])}")
+            out.append(f"{name}_count{format_labels(labels)} {value['count']}")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,117 @@
+import numpy as np
+
+from pricing import convert_currency, load_fx_rates, material_catalog, unit_cost_for_bom
+from recipes import list_products, product_bom
+
+
+MAX_MATRIX_QUANTITY = 10000
+
+
+def round_like_python(values, decimals):
+    # Round an array exactly as Python's round() would, fixing near-tie cells.
+    scale = 10.0 ** decimals
+    scaled = values * scale
+    rounded = np.round(scaled) / scale
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        flat = rounded.reshape(-1)
+        for idx in np.flatnonzero(near_tie.reshape(-1)):
+            flat[idx] = round(float(values.reshape(-1)[idx]), decimals)
+    return rounded
+
+
+def job_cost_vectors(bom, currency, catalog, fx_rates, warnings):
+    # Build per-unit qty, rounding and cost vectors for one job type's BOM in one currency.
+    missing = [name for name in bom.names if name not in catalog]
+    if missing:
+        raise ValueError(f"Missing materials in DB: {', '.join(missing)}")
+    per_unit_cost = []
+    for name, unit in zip(bom.names, bom.units):
+        info = catalog[name]
+        unit_cost = float(info["unit_cost"])
+        if info["currency"] != currency:
+            try:
+                unit_cost = convert_currency(unit_cost, info["currency"], currency, fx_rates)
+            except ValueError as exc:
+                warnings.append(
+                    f"{name} priced in {info['currency']} but quote currency is {currency}: {exc}"
+                )
+        per_unit_cost.append(unit_cost_for_bom(unit_cost, unit, info["unit"]))
+    qty_per_unit, precision = list(bom.qty_per_unit), list(bom.precision)
+    return qty_per_unit, precision, per_unit_cost
+
+
+def price_matrix(defaults, job_types=None, quantities=None, currencies=None, markup_pct=None, vat_pct=None):
+    # Price every job type x quantity x currency in one pass; arrays are [job, qty, currency].
+    fx_rates = load_fx_rates()
+    catalog = material_catalog(defaults["materials_db_path"])
+    base_currency = defaults["currency"]
+    job_types = list(job_types or list_products(defaults["materials_db_path"]))
+    if quantities is None:
+        quantities = np.arange(1, MAX_MATRIX_QUANTITY + 1)
+    quantities = np.asarray(quantities, dtype=np.int64)
+    if quantities.ndim != 1 or (quantities <= 0).any():
+        raise ValueError("quantities must be a list of positive integers")
+    if currencies is None:
+        currencies = sorted(set(fx_rates) | {base_currency})
+    currencies = [c.upper() for c in currencies]
+    markup_pct = defaults["markup_pct"] if markup_pct is None else markup_pct
+    vat_pct = defaults["vat_pct"] if vat_pct is None else vat_pct
+
+    shape = (len(job_types), len(quantities), len(currencies))
+    materials_subtotal = np.zeros(shape)
+    labor_cost = np.zeros(shape)
+    warnings = []
+    q = quantities.astype(np.float64)
+
+    labor_rates = []
+    for currency in currencies:
+        rate = float(defaults["labor_rate"])
+        if currency != base_currency:
+            try:
+                rate = convert_currency(rate, base_currency, currency, fx_rates)
+            except ValueError as exc:
+                warnings.append(f"Labor rate in {base_currency} but quote currency is {currency}: {exc}")
+        labor_rates.append(rate)
+    labor_rates = np.array(labor_rates)
+
+    for j, job_type in enumerate(job_types):
+        bom = product_bom(defaults["materials_db_path"], job_type)
+        labor_hours = round_like_python(bom.labor_hours * q, 3)
+        labor_cost[j] = labor_hours[:, None] * labor_rates[None, :]
+        scaled = None
+        for c, currency in enumerate(currencies):
+            qty_per_unit, precision, per_unit_cost = job_cost_vectors(bom, currency, catalog, fx_rates, warnings)
+            if scaled is None:
+                # Quantities only depend on the job type, so round them once.
+                scaled = [
+                    round_like_python(per_unit * q, digits)
+                    for per_unit, digits in zip(qty_per_unit, precision)
+                ]
+            # Accumulate in BOM order so sums match compute_costs bit for bit.
+            subtotal = np.zeros(len(quantities))
+            for qty, cost in zip(scaled, per_unit_cost):
+                subtotal = subtotal + qty * cost
+            materials_subtotal[j, :, c] = subtotal
+
+    subtotal = materials_subtotal + labor_cost
+    markup_value = subtotal * markup_pct
+    price_before_vat = subtotal + markup_value
+    vat_value = price_before_vat * vat_pct
+    total = price_before_vat + vat_value
+    unit_price = total / q[None, :, None]
+
+    return {
+        "job_types": job_types,
+        "quantities": quantities,
+        "currencies": currencies,
+        "materials_subtotal": materials_subtotal,
+        "labor_cost": labor_cost,
+        "subtotal": subtotal,
+        "markup_value": markup_value,
+        "price_before_vat": price_before_vat,
+        "vat_value": vat_value,
+        "total": total,
+        "unit_price": unit_price,
+        "warnings": sorted(set(warnings)),
+    }
@@ -1,17 +1,28 @@
 import datetime as dt
 import email.message
+import functools
+import io
 import json
 import os
 import re
-import sqlite3
+import secrets
+import signal
 import smtplib
-import urllib.request
+import threading
+import time
 import base64
+from types import MappingProxyType
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen import canvas
 
-from bom import list_job_types, scale_bom
+from artifact_store import artifact_store
+from env_settings import env_float, env_int, env_str
+from http_client import http_get_json, http_request
+from metrics import record_cache, timed_stage
+from recipes import list_products, product_bom
+from sqlite_pool import db_connection
+from units import conversion_factor
 
 
 DEFAULTS = {
@@ -25,51 +36,34 @@ DEFAULTS = {
     "quote_valid_days": 14,
 }
 
-def load_dotenv(path=".env"):
-    # Load simple key=value pairs into the environment.
-    if not os.path.exists(path):
-        return
-    with open(path, "r", encoding="utf-8") as f:
-        for raw in f:
-            line = raw.strip()
-            if not line or line.startswith("#") or "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key = key.strip()
-            value = value.strip().strip("'").strip('"')
-            if key:
-                os.environ[key] = value
-
+ARTIFACT_FORMATS = ("md", "txt", "pdf")
 
-load_dotenv()
-
-
-def env_float(name, default):
-    # Read a float from the env with a fallback.
-    val = os.environ.get(name)
-    if val is None or val == "":
-        return default
-    try:
-        return float(val)
-    except ValueError:
-        raise ValueError(f"{name} must be a number")
+_DOTENV_KEYS = {}
 
 
-def env_int(name, default):
-    # Read an int from the env with a fallback.
-    val = os.environ.get(name)
-    if val is None or val == "":
-        return default
-    try:
-        return int(val)
-    except ValueError:
-        raise ValueError(f"{name} must be an integer")
+def load_dotenv(path=".env"):
+    # Load simple key=value pairs into the environment, dropping keys an earlier load set that are gone now.
+    loaded = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for raw in f:
+                line = raw.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                key = key.strip()
+                value = value.strip().strip("'").strip('"')
+                if key:
+                    loaded[key] = value
+    for key, value in _DOTENV_KEYS.items():
+        if key not in loaded and os.environ.get(key) == value:
+            del os.environ[key]
+    os.environ.update(loaded)
+    _DOTENV_KEYS.clear()
+    _DOTENV_KEYS.update(loaded)
 
 
-def env_str(name, default):
-    # Read a string from the env with a fallback.
-    val = os.environ.get(name)
-    return default if val is None or val == "" else val
+load_dotenv()
 
 
 def parse_pct(value):
@@ -79,7 +73,7 @@ def parse_pct(value):
     return value / 100.0
 
 
-def get_defaults():
+def read_defaults():
     # Build a defaults dict from env overrides.
     return {
         "labor_rate": env_float("LABOR_RATE", DEFAULTS["labor_rate"]),
@@ -94,39 +88,123 @@ def get_defaults():
     }
 
 
-def load_fx_rates():
-    # Resolve FX rates from live API, cache, or env.
-    if os.environ.get("FX_LIVE", "").lower() in ("1", "true", "yes", "on"):
-        base = env_str("FX_BASE", DEFAULTS["currency"]).upper()
-        api_url = env_str("FX_API_URL", f"https://open.er-api.com/v6/latest/{base}")
-        cache_seconds = env_int("FX_CACHE_SECONDS", 3600)
-        cache_dir = env_str("OUTPUT_DIR", DEFAULTS["output_dir"])
-        cache_path = os.path.join(cache_dir, "fx_cache.json")
-        cached = load_fx_cache(cache_path, base, cache_seconds)
-        if cached:
-            print(f"[fx] using cached rates from {cache_path} (base {base})")
-            return cached
-        rates = fetch_fx_rates(api_url, base)
-        if rates:
-            save_fx_cache(cache_path, base, rates)
-            print(f"[fx] fetched live rates from {api_url} (base {base})")
-            return rates
+FX_REFRESH_AHEAD = 0.1
+FX_RETRY_SECONDS = 60
+
+_FX_LOCK = threading.Lock()
+_FX_STATE = {
+    "key": None,
+    "rates": MappingProxyType({}),
+    "fetched_at": 0.0,
+    "retry_at": 0.0,
+    "refreshing": False,
+}
+_FX_STATIC = {}
+
+
+def fx_live_enabled():
+    # Check whether live FX rates are switched on.
+    return os.environ.get("FX_LIVE", "").lower() in ("1", "true", "yes", "on")
+
+
+def static_fx_rates():
+    # Parse FX_RATES_JSON once per distinct value.
     raw = os.environ.get("FX_RATES_JSON", "").strip()
+    if raw in _FX_STATIC:
+        return _FX_STATIC[raw]
     if not raw:
         print("[fx] no rates configured; FX conversion disabled")
-        return {}
-    try:
-        data = json.loads(raw)
-        rates = {k.upper(): float(v) for k, v in data.items()}
+        rates = MappingProxyType({})
+    else:
+        try:
+            data = json.loads(raw)
+            rates = MappingProxyType({k.upper(): float(v) for k, v in data.items()})
+        except (ValueError, TypeError, AttributeError, json.JSONDecodeError):
+            raise ValueError("FX_RATES_JSON must be valid JSON mapping currency -> rate")
         print("[fx] using rates from FX_RATES_JSON")
-        return rates
-    except (ValueError, TypeError, json.JSONDecodeError):
-        raise ValueError("FX_RATES_JSON must be valid JSON mapping currency -> rate")
+    _FX_STATIC[raw] = rates
+    return rates
+
+
+def load_fx_rates():
+    # Resolve FX rates from memory, refreshing live rates in the background.
+    if not fx_live_enabled():
+        return static_fx_rates()
+    base = env_str("FX_BASE", DEFAULTS["currency"]).upper()
+    api_url = env_str("FX_API_URL", f"https://open.er-api.com/v6/latest/{base}")
+    cache_seconds = env_int("FX_CACHE_SECONDS", 3600)
+    cache_dir = env_str("OUTPUT_DIR", DEFAULTS["output_dir"])
+    cache_path = os.path.join(cache_dir, "fx_cache.json")
+    key = (base, api_url, cache_path)
+
+    state = _FX_STATE
+    if state["key"] != key:
+        seed_fx_rates(key)
+    now = time.time()
+    refresh_at = state["fetched_at"] + cache_seconds * (1 - FX_REFRESH_AHEAD)
+    if now >= refresh_at and now >= state["retry_at"] and not state["refreshing"]:
+        schedule_fx_refresh(key)
+    return state["rates"] or static_fx_rates()
+
+
+def seed_fx_rates(key):
+    # Prime the in-memory rates from the disk cache, whatever its age.
+    base, _, cache_path = key
+    with _FX_LOCK:
+        if _FX_STATE["key"] == key:
+            return
+        cached = read_fx_cache(cache_path, base)
+        rates, fetched_at = cached if cached else ({}, 0.0)
+        if rates:
+            print(f"[fx] using cached rates from {cache_path} (base {base})")
+        _FX_STATE.update(
+            key=key,
+            rates=MappingProxyType(rates),
+            fetched_at=fetched_at,
+            retry_at=0.0,
+        )
+
 
+def schedule_fx_refresh(key):
+    # Start one background refresh; concurrent callers share it.
+    with _FX_LOCK:
+        if _FX_STATE["refreshing"] or _FX_STATE["key"] != key:
+            return
+        _FX_STATE["refreshing"] = True
+    thread = threading.Thread(target=refresh_fx_rates, args=(key,), name="fx-refresh", daemon=True)
+    thread.start()
 
-def load_fx_cache(path, base, max_age_seconds):
-    # Read cached FX rates if still fresh.
-    if not path or max_age_seconds <= 0 or not os.path.exists(path):
+
+def refresh_fx_rates(key):
+    # Fetch live FX rates and publish them to the in-memory state.
+    base, api_url, cache_path = key
+    try:
+        rates = fetch_fx_rates(api_url, base)
+        with _FX_LOCK:
+            if _FX_STATE["key"] != key:
+                return
+            if not rates:
+                _FX_STATE["retry_at"] = time.time() + FX_RETRY_SECONDS
+                print(f"[fx] live rate refresh failed; retrying in {FX_RETRY_SECONDS}s")
+                return
+            _FX_STATE.update(
+                rates=MappingProxyType(rates),
+                fetched_at=time.time(),
+                retry_at=0.0,
+            )
+        print(f"[fx] fetched live rates from {api_url} (base {base})")
+        try:
+            save_fx_cache(cache_path, base, rates)
+        except OSError as exc:
+            print(f"[fx] could not write cache {cache_path}: {exc}")
+    finally:
+        with _FX_LOCK:
+            _FX_STATE["refreshing"] = False
+
+
+def read_fx_cache(path, base):
+    # Read cached FX rates and their timestamp regardless of age.
+    if not path or not os.path.exists(path):
         return None
     try:
         with open(path, "r", encoding="utf-8") as f:
@@ -134,11 +212,9 @@ def load_fx_cache(path, base, max_age_seconds):
         if payload.get("base", "").upper() != base:
             return None
         timestamp = int(payload.get("timestamp", 0))
-        if (dt.datetime.utcnow().timestamp() - timestamp) > max_age_seconds:
-            return None
         rates = payload.get("rates", {})
-        return {k.upper(): float(v) for k, v in rates.items()}
-    except (OSError, ValueError, TypeError, json.JSONDecodeError):
+        return {k.upper(): float(v) for k, v in rates.items()}, float(timestamp)
+    except (OSError, ValueError, TypeError, AttributeError, json.JSONDecodeError):
         return None
 
 
@@ -159,9 +235,7 @@ def save_fx_cache(path, base, rates):
 def fetch_fx_rates(api_url, base):
     # Fetch FX rates from the configured API.
     try:
-        with urllib.request.urlopen(api_url, timeout=8) as resp:
-            payload = resp.read().decode("utf-8")
-        data = json.loads(payload)
+        data = http_get_json(api_url, timeout=8)
         rates = data.get("rates") or {}
         if not isinstance(rates, dict):
             return {}
@@ -184,7 +258,7 @@ def convert_currency(amount, from_currency, to_currency, rates):
     return amount * (rates[to_cur] / rates[from_cur])
 
 
-def smtp_settings():
+def read_smtp_settings():
     # Gather SMTP settings if configured.
     host = os.environ.get("SMTP_HOST", "").strip()
     if not host:
@@ -206,7 +280,7 @@ def smtp_settings():
     }
 
 
-def resend_settings():
+def read_resend_settings():
     # Gather Resend settings if configured.
     api_key = os.environ.get("RESEND_API_KEY", "").strip()
     sender = os.environ.get("RESEND_FROM", "").strip()
@@ -215,7 +289,26 @@ def resend_settings():
     return {"api_key": api_key, "sender": sender}
 
 
-def sheets_settings():
+def read_mistral_settings():
+    # Gather the Mistral API settings; the API key may be empty when chat is not set up.
+    return {
+        "api_key": os.environ.get("MISTRAL_API_KEY", "").strip(),
+        "base_url": os.environ.get("MISTRAL_BASE_URL", "https://api.mistral.ai/v1").rstrip("/"),
+        "model": os.environ.get("MISTRAL_MODEL", "mistral-large-latest"),
+        "timeout": env_float("MISTRAL_TIMEOUT_SECONDS", 30.0),
+        "max_connections": env_int("MISTRAL_MAX_CONNECTIONS", 200),
+        "pool_timeout": env_float("MISTRAL_POOL_TIMEOUT_SECONDS", 5.0),
+    }
+
+
+def read_email_attachment_formats():
+    # Quote formats attached to emails, from EMAIL_ATTACHMENTS (default md,txt,pdf).
+    raw = os.environ.get("EMAIL_ATTACHMENTS", "md,txt,pdf")
+    formats = [part.strip().lower() for part in raw.split(",")]
+    return tuple(fmt for fmt in ARTIFACT_FORMATS if fmt in formats)
+
+
+def read_sheets_settings():
     # Gather Google Sheets settings if configured.
     sheet_id = os.environ.get("SHEET_ID", "").strip()
     if not sheet_id:
@@ -229,102 +322,422 @@ def sheets_settings():
     return {"sheet_id": sheet_id, "tab": tab, "creds_path": creds_path}
 
 
+_CONFIG_LOCK = threading.Lock()
+_CONFIG = {"snapshot": None}
+
+
+def frozen(settings):
+    # Wrap a settings dict read-only, keeping None for unconfigured integrations.
+    return None if settings is None else MappingProxyType(settings)
+
+
+def build_config(version):
+    # Parse every per-request setting from the environment into one immutable snapshot.
+    return MappingProxyType(
+        {
+            "version": version,
+            "defaults": frozen(read_defaults()),
+            "smtp": frozen(read_smtp_settings()),
+            "resend": frozen(read_resend_settings()),
+            "mistral": frozen(read_mistral_settings()),
+            "sheets": frozen(read_sheets_settings()),
+            "email_attachments": read_email_attachment_formats(),
+        }
+    )
+
+
+def config_snapshot():
+    # Return the current settings snapshot, building it on first use.
+    snapshot = _CONFIG["snapshot"]
+    if snapshot is not None:
+        return snapshot
+    with _CONFIG_LOCK:
+        if _CONFIG["snapshot"] is None:
+            _CONFIG["snapshot"] = build_config(1)
+        return _CONFIG["snapshot"]
+
+
+def config_version():
+    # Return a counter that changes whenever the settings are reloaded.
+    return config_snapshot()["version"]
+
+
+def reload_config(dotenv_path=".env"):
+    # Re-read .env and the environment into a new snapshot; the old one stays if parsing fails.
+    with _CONFIG_LOCK:
+        load_dotenv(dotenv_path)
+        current = _CONFIG["snapshot"]
+        snapshot = build_config((current["version"] if current else 0) + 1)
+        _CONFIG["snapshot"] = snapshot
+    print(f"[config] loaded settings version {snapshot['version']}")
+    return snapshot
+
+
+def reload_config_in_background(signum=None, frame=None):
+    # Signal-safe reload: hand the work to a thread so the handler never waits on a lock.
+    def run():
+        try:
+            reload_config()
+        except ValueError as exc:
+            print(f"[config] reload failed, keeping version {config_version()}: {exc}")
+
+    threading.Thread(target=run, name="config-reload", daemon=True).start()
+
+
+def install_config_reload_signal():
+    # Reload settings on SIGHUP where the platform and thread allow it.
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        signal.signal(signal.SIGHUP, reload_config_in_background)
+    except ValueError:
+        # signal.signal only works in the main thread (e.g. not under a test client).
+        pass
+
+
+def get_defaults():
+    # Current pricing defaults from the settings snapshot.
+    return config_snapshot()["defaults"]
+
+
+def smtp_settings():
+    # Current SMTP settings, or None if not configured.
+    return config_snapshot()["smtp"]
+
+
+def resend_settings():
+    # Current Resend settings, or None if not configured.
+    return config_snapshot()["resend"]
+
+
+def mistral_settings():
+    # Current Mistral API settings.
+    return config_snapshot()["mistral"]
+
+
+def email_attachment_formats():
+    # Quote formats attached to emails.
+    return config_snapshot()["email_attachments"]
+
+
+def sheets_settings():
+    # Current Google Sheets settings, or None if not configured.
+    return config_snapshot()["sheets"]
+
+
 def fetch_job_types():
-    # Return supported job types from the local BOM config.
-    return list_job_types()
+    # Return supported job types from the recipe tables.
+    return list_products(get_defaults()["materials_db_path"])
 
 
 def bom_estimate(job_type, quantity):
-    # Build a BOM estimate from the local BOM config.
-    return scale_bom(job_type, quantity)
+    # Build a BOM estimate from the flattened recipe for a job type.
+    return product_bom(get_defaults()["materials_db_path"], job_type).as_estimate(quantity)
+
+
+_CATALOG_LOCK = threading.Lock()
+_CATALOG = {}
+
+# Triggers bump the version on every write to materials, so changes made by other
+# processes or straight to the DB file invalidate cached snapshots too.
+CATALOG_VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS materials_version_insert AFTER INSERT ON materials
+BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS materials_version_update AFTER UPDATE ON materials
+BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS materials_version_delete AFTER DELETE ON materials
+BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END;
+"""
+
+_CATALOG_VERSION_READY = set()
+
+
+def ensure_catalog_version(db_path):
+    # Create the catalog version row and the triggers that maintain it.
+    if db_path in _CATALOG_VERSION_READY:
+        return
+    conn = db_connection(db_path)
+    with conn:
+        conn.executescript(CATALOG_VERSION_SCHEMA)
+    # Installed alongside, so price history triggers are in place before any write the app could miss.
+    ensure_price_history(db_path)
+    with _CATALOG_LOCK:
+        _CATALOG_VERSION_READY.add(db_path)
+
+
+def catalog_version(db_path):
+    # Return the material catalog version stored in the database.
+    ensure_catalog_version(db_path)
+    row = db_connection(db_path).execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+    return row[0]
+
+
+def invalidate_material_catalog():
+    # Drop cached material snapshots so the next lookup reloads them.
+    with _CATALOG_LOCK:
+        _CATALOG.clear()
+
+
+PRICE_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS material_prices (
+  id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  unit_cost REAL NOT NULL,
+  currency TEXT NOT NULL,
+  effective_from TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS material_prices_name_effective ON material_prices (name, effective_from);
+CREATE TRIGGER IF NOT EXISTS materials_price_insert AFTER INSERT ON materials
+BEGIN
+  INSERT INTO material_prices (name, unit_cost, currency, effective_from)
+  VALUES (NEW.name, NEW.unit_cost, NEW.currency, NEW.last_updated);
+END;
+CREATE TRIGGER IF NOT EXISTS materials_price_update AFTER UPDATE OF unit_cost, currency ON materials
+WHEN NEW.unit_cost IS NOT OLD.unit_cost OR NEW.currency IS NOT OLD.currency
+BEGIN
+  INSERT INTO material_prices (name, unit_cost, currency, effective_from)
+  VALUES (
+    NEW.name,
+    NEW.unit_cost,
+    NEW.currency,
+    CASE WHEN NEW.last_updated IS NOT OLD.last_updated THEN NEW.last_updated
+    ELSE strftime('%Y-%m-%dT%H:%M:%f000', 'now') END
+  );
+END;
+"""
+
+_PRICE_HISTORY_READY = set()
+
+
+def price_timestamp(value=None):
+    # Normalize a date, datetime or ISO string to the UTC text stored in effective_from.
+    if value is None:
+        value = dt.datetime.now(dt.timezone.utc)
+    if isinstance(value, str):
+        text = value.strip()
+        if re.match(r"^\d{4}-\d{2}-\d{2}$", text):
+            value = dt.date.fromisoformat(text)
+        else:
+            try:
+                value = dt.datetime.fromisoformat(text.replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError("as_of must be an ISO date or datetime")
+    if not isinstance(value, dt.datetime):
+        # A bare date means "as of the end of that day".
+        return f"{value.isoformat()}T23:59:59.999999"
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="microseconds")
+
+
+def ensure_price_history(db_path):
+    # Create the price history table and its triggers, seeding it with current prices not yet recorded.
+    if db_path in _PRICE_HISTORY_READY:
+        return
+    conn = db_connection(db_path)
+    with conn:
+        conn.executescript(PRICE_HISTORY_SCHEMA)
+        conn.execute(
+            "INSERT INTO material_prices (name, unit_cost, currency, effective_from) "
+            "SELECT name, unit_cost, currency, last_updated FROM materials "
+            "WHERE name NOT IN (SELECT name FROM material_prices)"
+        )
+    with _CATALOG_LOCK:
+        _PRICE_HISTORY_READY.add(db_path)
+
+
+def material_catalog(db_path):
+    # Return an immutable name -> material snapshot, reloading only when the DB version changes.
+    version = catalog_version(db_path)
+    snapshot = _CATALOG.get(db_path)
+    if snapshot is not None and snapshot["version"] == version:
+        record_cache("material_catalog", True)
+        return snapshot["materials"]
+    with _CATALOG_LOCK:
+        snapshot = _CATALOG.get(db_path)
+        if snapshot is not None and snapshot["version"] == version:
+            record_cache("material_catalog", True)
+            return snapshot["materials"]
+        record_cache("material_catalog", False)
+        # The version was read before the rows, so a write landing in between only causes an extra reload.
+        rows = db_connection(db_path).execute(
+            "SELECT name, unit, unit_cost, currency FROM materials ORDER BY name"
+        ).fetchall()
+        materials = MappingProxyType({row["name"]: MappingProxyType(dict(row)) for row in rows})
+        _CATALOG[db_path] = {"version": version, "materials": materials}
+    return materials
+
+
+def material_catalog_as_of(db_path, as_of):
+    # Return a catalog snapshot with each material's price as it stood at as_of.
+    ensure_price_history(db_path)
+    rows = db_connection(db_path).execute(
+        "SELECT m.name, m.unit, p.unit_cost, p.currency FROM materials m "
+        "JOIN material_prices p ON p.id = ("
+        "  SELECT id FROM material_prices WHERE name = m.name AND effective_from <= ? "
+        "  ORDER BY effective_from DESC, id DESC LIMIT 1"
+        ") ORDER BY m.name",
+        (price_timestamp(as_of),),
+    ).fetchall()
+    return MappingProxyType({row["name"]: MappingProxyType(dict(row)) for row in rows})
+
+
+def material_price_history(db_path, name):
+    # List a material's recorded prices, oldest first.
+    ensure_price_history(db_path)
+    rows = db_connection(db_path).execute(
+        "SELECT unit_cost, currency, effective_from FROM material_prices "
+        "WHERE name = ? ORDER BY effective_from, id",
+        (name,),
+    ).fetchall()
+    return [dict(row) for row in rows]
 
 
 def load_material_costs(db_path, names):
-    # Fetch material costs from SQLite.
+    # Fetch material costs from the cached catalog.
     if not names:
         return {}
-    placeholders = ",".join("?" for _ in names)
-    query = f"SELECT name, unit, unit_cost, currency FROM materials WHERE name IN ({placeholders})"
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute(query, list(names)).fetchall()
-    return {row["name"]: dict(row) for row in rows}
+    catalog = material_catalog(db_path)
+    return {name: dict(catalog[name]) for name in names if name in catalog}
 
 
 def list_materials(db_path):
-    # List all materials from SQLite.
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("SELECT name, unit, unit_cost, currency FROM materials ORDER BY name").fetchall()
-    return [dict(row) for row in rows]
+    # List all materials from the cached catalog.
+    return [dict(row) for row in material_catalog(db_path).values()]
 
 
 def get_material(db_path, name):
     # Look up a single material by name.
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute(
-            "SELECT name, unit, unit_cost, currency FROM materials WHERE name = ?",
-            (name,),
-        ).fetchone()
+    row = material_catalog(db_path).get(name)
     return dict(row) if row else None
 
 
 def update_material_cost(db_path, name, unit_cost):
-    # Update a material price in SQLite.
-    with sqlite3.connect(db_path) as conn:
+    # Update a material price in SQLite; the price history trigger records the change.
+    ensure_price_history(db_path)
+    effective_from = price_timestamp()
+    conn = db_connection(db_path)
+    with conn:
         cursor = conn.execute(
-            "UPDATE materials SET unit_cost = ? WHERE name = ?",
-            (unit_cost, name),
+            "UPDATE materials SET unit_cost = ?, last_updated = ? WHERE name = ?",
+            (unit_cost, effective_from, name),
         )
-        conn.commit()
         if cursor.rowcount == 0:
             raise ValueError("Material not found")
+    invalidate_material_catalog()
+
+
+MAX_BULK_PRICE_ROWS = 50000
+
+
+def bulk_update_material_costs(db_path, prices):
+    # Apply many name -> unit_cost updates in one transaction; the price history trigger records each change.
+    if len(prices) > MAX_BULK_PRICE_ROWS:
+        raise ValueError(f"Bulk updates are limited to {MAX_BULK_PRICE_ROWS} rows")
+    if not prices:
+        return 0
+    ensure_price_history(db_path)
+    effective_from = price_timestamp()
+    conn = db_connection(db_path)
+    with conn:
+        known = {row["name"] for row in conn.execute("SELECT name FROM materials")}
+        missing = [name for name in prices if name not in known]
+        if missing:
+            raise ValueError(f"Material not found: {', '.join(missing[:20])}")
+        conn.executemany(
+            "UPDATE materials SET unit_cost = ?, last_updated = ? WHERE name = ?",
+            [(unit_cost, effective_from, name) for name, unit_cost in prices.items()],
+        )
+    invalidate_material_catalog()
+    return len(prices)
 
 
 def convert_qty(qty, from_unit, to_unit):
-    # Convert quantities between supported units.
-    if from_unit == to_unit:
-        return qty
-    if from_unit == "g" and to_unit == "kg":
-        return qty * 0.001
-    if from_unit == "kg" and to_unit == "g":
-        return qty * 1000
-    if from_unit == "ml" and to_unit == "L":
-        return qty / 1000.0
-    if from_unit == "L" and to_unit == "ml":
-        return qty * 1000.0
-    raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    # Convert quantities between any units the unit registry can relate.
+    return qty * conversion_factor(from_unit, to_unit)
 
 
 def unit_cost_for_bom(unit_cost_db, bom_unit, db_unit):
     # Translate DB unit cost into BOM unit cost.
-    factor = convert_qty(1, bom_unit, db_unit)
-    return unit_cost_db * factor
-
-
-def render_template(template_text, data):
-    # Fill the quote template using simple token replacement.
-    section_pattern = re.compile(r"{{#lines}}(.*?){{/lines}}", re.S)
+    return unit_cost_db * conversion_factor(bom_unit, db_unit)
+
+
+TEMPLATE_TOKEN_PATTERN = re.compile(r"{{([#/]?)([A-Za-z0-9_]+)}}")
+
+_TEMPLATE_LOCK = threading.Lock()
+_TEMPLATE_CACHE = {}
+
+
+@functools.lru_cache(maxsize=32)
+def compile_template(template_text):
+    # Parse a template into text, variable and section tokens.
+    root = []
+    stack = [(None, root)]
+    pos = 0
+    for match in TEMPLATE_TOKEN_PATTERN.finditer(template_text):
+        kind, name = match.groups()
+        if match.start() > pos:
+            stack[-1][1].append(("text", template_text[pos:match.start()]))
+        pos = match.end()
+        if kind == "#":
+            stack.append((name, []))
+        elif kind == "/":
+            if stack[-1][0] != name:
+                raise ValueError(f"Unbalanced template section: {{{{/{name}}}}}")
+            section_name, body = stack.pop()
+            stack[-1][1].append(("section", section_name, tuple(body)))
+        else:
+            stack[-1][1].append(("var", name))
+    if len(stack) > 1:
+        raise ValueError(f"Unclosed template section: {{{{#{stack[-1][0]}}}}}")
+    if pos < len(template_text):
+        root.append(("text", template_text[pos:]))
+    return tuple(root)
+
+
+def load_template(path):
+    # Return the compiled template at path, recompiling only when its mtime changes.
+    mtime = os.stat(path).st_mtime_ns
+    cached = _TEMPLATE_CACHE.get(path)
+    record_cache("template", cached is not None and cached[0] == mtime)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        compiled = compile_template(f.read())
+    with _TEMPLATE_LOCK:
+        _TEMPLATE_CACHE[path] = (mtime, compiled)
+    return compiled
+
+
+def render_compiled(tokens, data):
+    # Render compiled template tokens with a single join.
+    out = []
+
+    def emit(tokens, context):
+        # Append rendered fragments for one token list.
+        for token in tokens:
+            kind = token[0]
+            if kind == "text":
+                out.append(token[1])
+            elif kind == "var":
+                name = token[1]
+                out.append(str(context[name]) if name in context else f"{{{{{name}}}}}")
+            else:
+                for item in context.get(token[1]) or []:
+                    emit(token[2], {**context, **item})
 
-    def replace_vars(text, context):
-        # Replace simple placeholders in the template block.
-        for key, value in context.items():
-            text = text.replace(f"{{{{{key}}}}}", str(value))
-        return text
+    emit(tokens, data)
+    return "".join(out)
 
-    def render_section(match):
-        # Expand the repeating lines section.
-        block = match.group(1)
-        lines_out = []
-        for line in data.get("lines", []):
-            merged = {**data, **line}
-            lines_out.append(replace_vars(block, merged))
-        return "".join(lines_out)
 
-    rendered = section_pattern.sub(render_section, template_text)
-    rendered = replace_vars(rendered, data)
-    return rendered
+def render_template(template_text, data):
+    # Fill the quote template from its compiled token list.
+    return render_compiled(compile_template(template_text), data)
 
 
 def fmt_money(value):
@@ -349,21 +762,10 @@ def markdown_to_text(markdown_text):
     return "\n".join(lines).strip() + "\n"
 
 
-def write_text_version(markdown_text, out_md_path):
-    # Emit a plain-text version next to the markdown.
-    base = os.path.splitext(out_md_path)[0]
-    out_txt = f"{base}.txt"
-    text = markdown_to_text(markdown_text)
-    with open(out_txt, "w", encoding="utf-8") as f:
-        f.write(text)
-    return out_txt
-
-
-def write_pdf_version(out_md_path, data, lines):
-    # Render a simple PDF version of the quote.
-    base = os.path.splitext(out_md_path)[0]
-    out_pdf = f"{base}.pdf"
-    c = canvas.Canvas(out_pdf, pagesize=A4)
+def render_pdf_bytes(data, lines):
+    # Render a simple PDF version of the quote into memory.
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
     width, height = A4
     margin_x = 50
     y = height - 60
@@ -409,7 +811,7 @@ def write_pdf_version(out_md_path, data, lines):
         f"Date: {data['quote_date']}",
         f"Valid Until: {data['valid_until']}",
         f"Customer: {data['customer_name']}",
-        f"Project: {data['job_type']} × {data['quantity']}",
+        f"Project: {data.get('project') or data['job_type'] + ' × ' + str(data['quantity'])}",
         f"Delivery / Due: {data['due_date']}",
     ]
     for line in meta_lines:
@@ -481,11 +883,20 @@ def write_pdf_version(out_md_path, data, lines):
     c.drawString(x, y, "Thank you for your business!")
 
     c.save()
-    return out_pdf
+    return buffer.getvalue()
+
+
+def read_attachment(attachment):
+    # Accept a (filename, bytes) pair or a file path and return (filename, bytes).
+    if isinstance(attachment, (tuple, list)):
+        filename, data = attachment
+        return os.path.basename(filename), data
+    with open(attachment, "rb") as f:
+        return os.path.basename(attachment), f.read()
 
 
-def send_quote_email(settings, recipient, subject, body, attachments):
-    # Send the quote via SMTP with attachments.
+def build_quote_email(settings, recipient, subject, body, attachments):
+    # Build the quote email message with attachments.
     if not settings or not settings.get("sender"):
         raise ValueError("SMTP settings are missing or incomplete")
 
@@ -495,10 +906,7 @@ def send_quote_email(settings, recipient, subject, body, attachments):
     msg["Subject"] = subject
     msg.set_content(body)
 
-    for path in attachments:
-        with open(path, "rb") as f:
-            data = f.read()
-        filename = os.path.basename(path)
+    for filename, data in map(read_attachment, attachments):
         maintype = "text"
         subtype = "plain"
         if filename.endswith(".md"):
@@ -507,18 +915,25 @@ def send_quote_email(settings, recipient, subject, body, attachments):
             maintype = "application"
             subtype = "pdf"
         msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+    return msg
 
+
+def open_smtp_connection(settings):
+    # Connect, upgrade to TLS and log in to the configured SMTP server.
     timeout = int(os.environ.get("SMTP_TIMEOUT", "15"))
     if settings["use_ssl"]:
         server = smtplib.SMTP_SSL(settings["host"], settings["port"], timeout=timeout)
     else:
         server = smtplib.SMTP(settings["host"], settings["port"], timeout=timeout)
-    with server:
+    try:
         if settings["use_tls"] and not settings["use_ssl"]:
             server.starttls()
         if settings["user"] and settings["password"]:
             server.login(settings["user"], settings["password"])
-        server.send_message(msg)
+    except Exception:
+        server.close()
+        raise
+    return server
 
 
 def send_quote_email_resend(settings, recipient, subject, body, attachments):
@@ -534,103 +949,196 @@ def send_quote_email_resend(settings, recipient, subject, body, attachments):
         "attachments": [],
     }
 
-    for path in attachments:
-        with open(path, "rb") as f:
-            data = f.read()
+    for filename, data in map(read_attachment, attachments):
         payload["attachments"].append(
             {
-                "filename": os.path.basename(path),
+                "filename": filename,
                 "content": base64.b64encode(data).decode("ascii"),
             }
         )
 
-    req = urllib.request.Request(
-        "https://api.resend.com/emails",
-        data=json.dumps(payload).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {settings['api_key']}",
-            "Content-Type": "application/json",
-        },
-    )
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        if resp.status < 200 or resp.status >= 300:
-            detail = resp.read().decode("utf-8")
-            raise RuntimeError(f"Resend API error {resp.status}: {detail}")
+    with timed_stage("resend_send"):
+        resp = http_request(
+            "POST",
+            "https://api.resend.com/emails",
+            timeout=20,
+            content=json.dumps(payload).encode("utf-8"),
+            headers={
+                "Authorization": f"Bearer {settings['api_key']}",
+                "Content-Type": "application/json",
+            },
+        )
+    if resp.status_code < 200 or resp.status_code >= 300:
+        raise RuntimeError(f"Resend API error {resp.status_code}: {resp.text}")
+
+
+_SHEETS_LOCK = threading.Lock()
+_SHEETS_SERVICES = {}
+_SHEETS_HEADERS_READY = set()
 
 
-def append_quote_to_sheet(settings, headers, row):
-    # Append quote data to a Google Sheet.
+def sheets_service(settings):
+    # Return the cached Sheets API client for a service-account file.
     from google.oauth2 import service_account
     from googleapiclient.discovery import build
 
-    if not os.path.exists(settings["creds_path"]):
+    creds_path = settings["creds_path"]
+    with _SHEETS_LOCK:
+        service = _SHEETS_SERVICES.get(creds_path)
+        if service is not None:
+            return service
+    if not os.path.exists(creds_path):
         raise ValueError("Service account JSON not found")
-
     scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = service_account.Credentials.from_service_account_file(
-        settings["creds_path"], scopes=scopes
-    )
+    creds = service_account.Credentials.from_service_account_file(creds_path, scopes=scopes)
     service = build("sheets", "v4", credentials=creds, cache_discovery=False)
-    sheet_id = settings["sheet_id"]
-    tab = settings["tab"]
-
-    safe_tab = f"'{tab}'" if " " in tab else tab
-    existing = (
-        service.spreadsheets()
-        .values()
-        .get(spreadsheetId=sheet_id, range=f"{safe_tab}!1:1")
-        .execute()
-    )
-    if not existing.get("values"):
-        service.spreadsheets().values().update(
-            spreadsheetId=sheet_id,
-            range=f"{safe_tab}!1:1",
-            valueInputOption="USER_ENTERED",
-            body={"values": [headers]},
-        ).execute()
-
-    service.spreadsheets().values().append(
-        spreadsheetId=sheet_id,
-        range=f"{safe_tab}!A1",
-        valueInputOption="USER_ENTERED",
-        insertDataOption="INSERT_ROWS",
-        body={"values": [row]},
-    ).execute()
-
-
-def compute_costs(inputs, defaults):
-    # Calculate line items and totals from inputs.
-    fx_rates = load_fx_rates()
-    estimate = bom_estimate(inputs["job_type"], inputs["quantity"])
-    materials = estimate["materials"]
-    labor_hours = float(estimate["labor_hours"])
+    with _SHEETS_LOCK:
+        return _SHEETS_SERVICES.setdefault(creds_path, service)
+
+
+def append_rows_to_sheet(settings, headers, rows):
+    # Append rows to a Google Sheet in one call, writing the header row first if the sheet is empty.
+    with timed_stage("sheets_append"):
+        service = sheets_service(settings)
+        sheet_id = settings["sheet_id"]
+        tab = settings["tab"]
+        safe_tab = f"'{tab}'" if " " in tab else tab
+        header_key = (sheet_id, tab)
+
+        try:
+            if header_key not in _SHEETS_HEADERS_READY:
+                existing = (
+                    service.spreadsheets()
+                    .values()
+                    .get(spreadsheetId=sheet_id, range=f"{safe_tab}!1:1")
+                    .execute()
+                )
+                if not existing.get("values"):
+                    service.spreadsheets().values().update(
+                        spreadsheetId=sheet_id,
+                        range=f"{safe_tab}!1:1",
+                        valueInputOption="USER_ENTERED",
+                        body={"values": [headers]},
+                    ).execute()
+                with _SHEETS_LOCK:
+                    _SHEETS_HEADERS_READY.add(header_key)
+
+            service.spreadsheets().values().append(
+                spreadsheetId=sheet_id,
+                range=f"{safe_tab}!A1",
+                valueInputOption="USER_ENTERED",
+                insertDataOption="INSERT_ROWS",
+                body={"values": rows},
+            ).execute()
+        except Exception:
+            # The sheet may have been cleared or replaced; check the headers again next time.
+            with _SHEETS_LOCK:
+                _SHEETS_HEADERS_READY.discard(header_key)
+            raise
+
+
+MAX_QUOTE_ITEMS = 50
+
+
+def quote_items(inputs):
+    # The (job_type, quantity) pairs a quote covers: its items list, or its single job_type x quantity.
+    items = inputs.get("items")
+    if not items:
+        return [(inputs["job_type"], inputs["quantity"])]
+    if not isinstance(items, list) or len(items) > MAX_QUOTE_ITEMS:
+        raise ValueError(f"items must be a list of at most {MAX_QUOTE_ITEMS} entries")
+    pairs = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("job_type"):
+            raise ValueError("Each item needs a job_type and quantity")
+        try:
+            quantity = int(item.get("quantity", 0))
+        except (TypeError, ValueError):
+            raise ValueError("Item quantity must be an integer")
+        pairs.append((str(item["job_type"]), quantity))
+    return pairs
+
+
+def apply_quote_items(inputs):
+    # Normalize a multi-item order in place, labelling it with its job types and total quantity.
+    if not inputs.get("items"):
+        inputs.pop("items", None)
+        return inputs
+    pairs = quote_items(inputs)
+    inputs["items"] = [{"job_type": job_type, "quantity": quantity} for job_type, quantity in pairs]
+    if len(pairs) == 1:
+        inputs["job_type"], inputs["quantity"] = pairs[0]
+        del inputs["items"]
+        return inputs
+    inputs["job_type"] = " + ".join(dict.fromkeys(job_type for job_type, _ in pairs))
+    inputs["quantity"] = sum(quantity for _, quantity in pairs)
+    return inputs
+
+
+def project_summary(inputs):
+    # One-line description of what a quote covers, e.g. "cupcakes × 24 + cake × 2".
+    return " + ".join(f"{job_type} × {quantity}" for job_type, quantity in quote_items(inputs))
+
+
+def aggregate_bom(db_path, items):
+    # Merge the scaled BOMs of several items so shared materials become one line each.
+    totals = {}
+    labor_hours = 0.0
+    for job_type, quantity in items:
+        bom = product_bom(db_path, job_type)
+        qtys, labor = bom.scale(quantity)
+        labor_hours += labor
+        for name, unit, qty, digits in zip(bom.names, bom.units, qtys, bom.precision):
+            previous = totals.get((name, unit))
+            totals[(name, unit)] = qty if previous is None else round(previous + qty, digits)
+    names = tuple(name for name, _ in totals)
+    units = tuple(unit for _, unit in totals)
+    return names, units, tuple(totals.values()), round(labor_hours, 3)
+
+
+def compute_costs(inputs, defaults, catalog=None, fx_rates=None, as_of=None):
+    # Calculate line items and totals from inputs, at historical prices when as_of is given.
+    if fx_rates is None:
+        fx_rates = load_fx_rates()
+    if catalog is None and as_of is not None:
+        catalog = material_catalog_as_of(defaults["materials_db_path"], as_of)
+    elif catalog is None:
+        catalog = material_catalog(defaults["materials_db_path"])
+    items = quote_items(inputs)
+    if len(items) == 1:
+        bom = product_bom(defaults["materials_db_path"], items[0][0])
+        names, units = bom.names, bom.units
+        qtys, labor_hours = bom.scale(items[0][1])
+    else:
+        names, units, qtys, labor_hours = aggregate_bom(defaults["materials_db_path"], items)
+    labor_hours = float(labor_hours)
 
-    material_names = [m["name"] for m in materials]
-    costs = load_material_costs(defaults["materials_db_path"], material_names)
-    missing = [name for name in material_names if name not in costs]
+    costs = catalog
+    missing = [name for name in names if name not in costs]
     if missing:
-        raise ValueError(f"Missing materials in DB: {', '.join(missing)}")
+        when = f" as of {as_of}" if as_of is not None else ""
+        raise ValueError(f"Missing materials in DB{when}: {', '.join(missing)}")
 
     lines = []
     materials_subtotal = 0.0
-    for m in materials:
-        info = costs[m["name"]]
+    for name, unit, qty in zip(names, units, qtys):
+        info = costs[name]
         unit_cost = float(info["unit_cost"])
         if info["currency"] != inputs["currency"]:
             try:
                 unit_cost = convert_currency(unit_cost, info["currency"], inputs["currency"], fx_rates)
             except ValueError as exc:
                 inputs.setdefault("warnings", []).append(
-                    f"{m['name']} priced in {info['currency']} but quote currency is {inputs['currency']}: {exc}"
+                    f"{name} priced in {info['currency']} but quote currency is {inputs['currency']}: {exc}"
                 )
-        per_unit_cost = unit_cost_for_bom(unit_cost, m["unit"], info["unit"])
-        line_cost = m["qty"] * per_unit_cost
+        per_unit_cost = unit_cost_for_bom(unit_cost, unit, info["unit"])
+        line_cost = qty * per_unit_cost
         materials_subtotal += line_cost
         lines.append(
             {
-                "name": m["name"],
-                "qty": m["qty"],
-                "unit": m["unit"],
+                "name": name,
+                "qty": qty,
+                "unit": unit,
                 "unit_cost": fmt_money(per_unit_cost),
                 "line_cost": fmt_money(line_cost),
             }
@@ -655,7 +1163,6 @@ def compute_costs(inputs, defaults):
     price_before_vat = subtotal + markup_value
     vat_value = price_before_vat * inputs["vat_pct"]
     total = price_before_vat + vat_value
-    unit_price = total / inputs["quantity"] if inputs["quantity"] else 0
 
     summary = {
         "materials_subtotal": fmt_money(materials_subtotal),
@@ -666,22 +1173,91 @@ def compute_costs(inputs, defaults):
         "price_before_vat": fmt_money(price_before_vat),
         "vat_value": fmt_money(vat_value),
         "total": fmt_money(total),
-        "unit_price": fmt_money(unit_price),
     }
+    # A unit price only means something for a single product; mixed orders leave it out.
+    if len(items) == 1:
+        summary["unit_price"] = fmt_money(total / items[0][1] if items[0][1] else 0)
     return lines, summary
 
 
-def build_quote(inputs, defaults, lines=None, summary=None):
-    # Render outputs and write files to disk.
+MAX_BATCH_ITEMS = 10000
+
+
+def compute_costs_batch(items, defaults):
+    # Price many jobs against one catalog and FX snapshot.
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"Batch is limited to {MAX_BATCH_ITEMS} items")
+    fx_rates = load_fx_rates()
+    catalog = material_catalog(defaults["materials_db_path"])
+    results = []
+    for inputs in items:
+        try:
+            lines, summary = compute_costs(inputs, defaults, catalog=catalog, fx_rates=fx_rates)
+        except (KeyError, TypeError, ValueError) as exc:
+            results.append({"error": str(exc)})
+            continue
+        results.append(
+            {
+                "job_type": inputs["job_type"],
+                "quantity": inputs["quantity"],
+                "currency": inputs["currency"],
+                "lines": lines,
+                "summary": summary,
+                "warnings": inputs.get("warnings", []),
+            }
+        )
+    return results
+
+
+def artifact_name(quote_id, fmt):
+    # Store name of a quote artifact (md/txt/pdf) or its canonical json record.
+    return f"quote_{quote_id}.{fmt}"
+
+
+def artifact_path(output_dir, quote_id, fmt):
+    # Path a quote artifact would have in the local artifact store.
+    return os.path.join(output_dir, artifact_name(quote_id, fmt))
+
+
+def write_quote_record(store, record):
+    # Persist the canonical quote data that artifacts are rendered from.
+    store.put(artifact_name(record["quote_id"], "json"), json.dumps(record).encode("utf-8"))
+
+
+def load_quote_record(store, quote_id):
+    # Read a quote's canonical record, or None if it was never generated.
+    raw = store.get(artifact_name(quote_id, "json"))
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw.decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def new_quote_id(store, quote_date, quantity):
+    # Readable date and quantity prefix plus a random suffix, so two quotes never share an ID.
+    prefix = f"Q-{quote_date.strftime('%Y%m%d')}-{quantity:03d}"
+    while True:
+        quote_id = f"{prefix}-{secrets.token_hex(3).upper()}"
+        if not store.exists(artifact_name(quote_id, "json")):
+            return quote_id
+
+
+def build_quote(inputs, defaults, lines=None, summary=None, store=None, fingerprint=None):
+    # Price and render a quote, persisting only its canonical record; artifacts render on demand.
     if lines is None or summary is None:
-        lines, summary = compute_costs(inputs, defaults)
+        with timed_stage("compute_costs"):
+            lines, summary = compute_costs(inputs, defaults)
 
     quote_date = dt.date.today()
     valid_until = quote_date + dt.timedelta(days=defaults["quote_valid_days"])
-    quote_id = f"Q-{quote_date.strftime('%Y%m%d')}-{inputs['quantity']:03d}"
+    output_dir = defaults["output_dir"]
+    if store is None:
+        store = artifact_store(output_dir)
+    quote_id = new_quote_id(store, quote_date, inputs["quantity"])
 
-    with open(defaults["template_path"], "r", encoding="utf-8") as f:
-        template_text = f.read()
+    template = load_template(defaults["template_path"])
 
     data = {
         "company_name": inputs["company_name"],
@@ -691,6 +1267,8 @@ def build_quote(inputs, defaults, lines=None, summary=None):
         "customer_name": inputs["customer_name"],
         "job_type": inputs["job_type"],
         "quantity": inputs["quantity"],
+        "project": project_summary(inputs),
+        "items": [{"job_type": job_type, "quantity": quantity} for job_type, quantity in quote_items(inputs)],
         "due_date": inputs["due_date"],
         "currency": inputs["currency"],
         "lines": lines,
@@ -708,21 +1286,20 @@ def build_quote(inputs, defaults, lines=None, summary=None):
         "notes": f"{inputs['notes']} (Customer email: {inputs['customer_email']})",
     }
 
-    rendered = render_template(template_text, data)
-    os.makedirs(defaults["output_dir"], exist_ok=True)
-    out_path = os.path.join(defaults["output_dir"], f"quote_{quote_id}.md")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write(rendered)
-    out_txt_path = write_text_version(rendered, out_path)
-    out_pdf_path = write_pdf_version(out_path, data, lines)
+    with timed_stage("render_template"):
+        rendered = render_compiled(template, data)
+    with timed_stage("write_record"):
+        write_quote_record(
+            store, {"quote_id": quote_id, "data": data, "markdown": rendered, "fingerprint": fingerprint}
+        )
 
     return {
         "quote_id": quote_id,
         "quote_date": quote_date.isoformat(),
         "valid_until": valid_until.isoformat(),
-        "out_path": out_path,
-        "out_txt_path": out_txt_path,
-        "out_pdf_path": out_pdf_path,
+        "out_path": artifact_path(output_dir, quote_id, "md"),
+        "out_txt_path": artifact_path(output_dir, quote_id, "txt"),
+        "out_pdf_path": artifact_path(output_dir, quote_id, "pdf"),
         "markdown": rendered,
         "lines": lines,
         "summary": summary,
@@ -0,0 +1,125 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import observe, record_cache, timed_stage
+from pricing import (
+    ARTIFACT_FORMATS,
+    artifact_name,
+    env_int,
+    load_quote_record,
+    markdown_to_text,
+    render_pdf_bytes,
+)
+
+
+MAX_TRACKED_JOBS = 1000
+PDF_WAIT_SECONDS = 60
+
+_POOL_LOCK = threading.Lock()
+_POOL = None
+# Render jobs by quote ID; IDs carry a random suffix, so no two quotes share an entry.
+_JOBS = OrderedDict()
+
+
+def pdf_pool():
+    # Create the PDF worker pool on first use.
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            workers = max(1, env_int("PDF_WORKERS", 2))
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+
+def shutdown_pdf_pool(wait=True):
+    # Stop the PDF workers, letting queued renders finish.
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+
+def submit_pdf_render(store, record):
+    # Queue a PDF render for a quote record, sharing any render already in flight.
+    quote_id = record["quote_id"]
+    with _POOL_LOCK:
+        job = _JOBS.get(quote_id)
+        if job is not None and not job["future"].done():
+            return job["future"]
+    data = record["data"]
+    submitted = time.perf_counter()
+    try:
+        future = pdf_pool().submit(render_pdf_bytes, data, data["lines"])
+    except BrokenProcessPool:
+        # A crashed worker poisons the pool; start a fresh one and retry once.
+        shutdown_pdf_pool(wait=False)
+        future = pdf_pool().submit(render_pdf_bytes, data, data["lines"])
+
+    def store_pdf(done):
+        # Save the rendered bytes once the worker finishes; the timing includes time queued for a worker.
+        observe("quote_stage_seconds", time.perf_counter() - submitted, stage="pdf_render")
+        if not done.cancelled() and done.exception() is None:
+            store.put(artifact_name(quote_id, "pdf"), done.result())
+
+    future.add_done_callback(store_pdf)
+    with _POOL_LOCK:
+        _JOBS.pop(quote_id, None)
+        _JOBS[quote_id] = {"future": future, "submitted_at": time.time()}
+        while len(_JOBS) > MAX_TRACKED_JOBS:
+            _JOBS.popitem(last=False)
+    return future
+
+
+def render_text_artifact(store, record, fmt):
+    # Render and store the markdown or plain-text artifact from a quote record.
+    with timed_stage(f"{fmt}_render"):
+        if fmt == "txt":
+            data = markdown_to_text(record["markdown"]).encode("utf-8")
+        else:
+            data = record["markdown"].encode("utf-8")
+        store.put(artifact_name(record["quote_id"], fmt), data)
+    return data
+
+
+def ensure_artifact(store, quote_id, fmt):
+    # Return the artifact bytes, rendering them on first access; None if the quote is unknown.
+    if fmt not in ARTIFACT_FORMATS:
+        return None
+    data = store.get(artifact_name(quote_id, fmt))
+    record_cache("artifact", data is not None)
+    if data is not None:
+        return data
+    record = load_quote_record(store, quote_id)
+    if record is None:
+        return None
+    if fmt == "pdf":
+        return submit_pdf_render(store, record).result(timeout=PDF_WAIT_SECONDS)
+    return render_text_artifact(store, record, fmt)
+
+
+def pending_pdf_renders():
+    # Count PDF renders queued or running in the worker pool.
+    with _POOL_LOCK:
+        return sum(1 for job in _JOBS.values() if not job["future"].done())
+
+
+def pdf_status(quote_id, store):
+    # Report whether a quote's PDF is ready, pending, failed or renderable on demand.
+    job = _JOBS.get(quote_id)
+    if job is not None:
+        future = job["future"]
+        if not future.done():
+            return {"status": "pending"}
+        exc = future.exception()
+        if exc is not None:
+            return {"status": "failed", "error": f"{exc.__class__.__name__}: {exc}"}
+    if store.exists(artifact_name(quote_id, "pdf")):
+        return {"status": "ready"}
+    if store.exists(artifact_name(quote_id, "json")):
+        return {"status": "available"}
+    return {"status": "unknown"}
@@ -0,0 +1,112 @@
+import asyncio
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from metrics import record_cache
+from pricing import catalog_version, load_fx_rates, load_quote_record
+from recipes import recipe_version
+
+
+MAX_MEMO_ENTRIES = 1024
+MEMO_TTL_SECONDS = 6 * 3600
+
+QUOTE_INPUT_FIELDS = (
+    "job_type",
+    "quantity",
+    "items",
+    "due_date",
+    "company_name",
+    "customer_name",
+    "customer_email",
+    "currency",
+    "labor_rate",
+    "markup_pct",
+    "vat_pct",
+    "notes",
+)
+
+_MEMO_LOCK = threading.Lock()
+_MEMO = OrderedDict()
+_KEY_LOCKS = weakref.WeakValueDictionary()
+
+
+def canonical_value(value):
+    # Normalize an input value so cosmetic differences hash the same.
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def quote_fingerprint(inputs, defaults):
+    # Hash quote inputs together with the catalog, recipe and template versions, the FX rates and the quote settings.
+    canonical = {field: canonical_value(inputs.get(field)) for field in QUOTE_INPUT_FIELDS}
+    canonical["currency"] = str(canonical["currency"] or "").upper()
+    canonical["customer_email"] = str(canonical["customer_email"] or "").lower()
+    try:
+        template_mtime = os.stat(defaults["template_path"]).st_mtime_ns
+    except OSError:
+        template_mtime = None
+    payload = {
+        "inputs": canonical,
+        "quote_date": dt.date.today().isoformat(),
+        "catalog_version": catalog_version(defaults["materials_db_path"]),
+        "recipe_version": recipe_version(defaults["materials_db_path"]),
+        # The active rates themselves, so a changed FX_RATES_JSON or a live refresh both change the key.
+        "fx_rates": dict(load_fx_rates()),
+        "template_mtime": template_mtime,
+        # The settings values themselves, not the reload counter, so a reload that changes nothing keeps hits.
+        "defaults": dict(defaults),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def recorded_quote_matches(store, quote_id, key):
+    # True if the stored record for quote_id was built from the inputs behind this fingerprint.
+    record = load_quote_record(store, quote_id)
+    return record is not None and record.get("fingerprint") == key
+
+
+def quote_lock(key):
+    # Return the asyncio lock that serializes work on one fingerprint.
+    with _MEMO_LOCK:
+        lock = _KEY_LOCKS.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            _KEY_LOCKS[key] = lock
+        return lock
+
+
+def recall_quote(key):
+    # Return the memoized result and email status for a fingerprint, if still fresh.
+    with _MEMO_LOCK:
+        entry = _MEMO.get(key)
+        if entry is not None and time.time() - entry["stored_at"] > MEMO_TTL_SECONDS:
+            del _MEMO[key]
+            entry = None
+        if entry is not None:
+            _MEMO.move_to_end(key)
+    record_cache("quote_memo", entry is not None)
+    return entry
+
+
+def remember_quote(key, result, email_state, outbox_id=None):
+    # Memoize a generated quote, its email status and outbox entry.
+    with _MEMO_LOCK:
+        _MEMO.pop(key, None)
+        _MEMO[key] = {
+            "result": result,
+            "email_state": email_state,
+            "outbox_id": outbox_id,
+            "stored_at": time.time(),
+        }
+        while len(_MEMO) > MAX_MEMO_ENTRIES:
+            _MEMO.popitem(last=False)
@@ -0,0 +1,231 @@
+import datetime as dt
+import threading
+
+from bom import BOM_PER_UNIT, CompiledBom
+from metrics import record_cache
+from sqlite_pool import db_connection
+from units import conversion_factor
+
+
+RECIPE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+  name TEXT PRIMARY KEY,
+  labor_hours REAL NOT NULL DEFAULT 0,
+  is_product INTEGER NOT NULL DEFAULT 1,
+  updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipe_items (
+  id INTEGER PRIMARY KEY,
+  recipe TEXT NOT NULL REFERENCES recipes (name),
+  position INTEGER NOT NULL,
+  material TEXT,
+  sub_recipe TEXT REFERENCES recipes (name),
+  unit TEXT,
+  qty REAL NOT NULL,
+  CHECK ((material IS NULL) != (sub_recipe IS NULL))
+);
+CREATE INDEX IF NOT EXISTS recipe_items_recipe ON recipe_items (recipe, position);
+CREATE INDEX IF NOT EXISTS recipe_items_sub_recipe ON recipe_items (sub_recipe);
+CREATE TABLE IF NOT EXISTS recipe_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO recipe_version (id, version) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS recipes_version_insert AFTER INSERT ON recipes
+BEGIN UPDATE recipe_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS recipes_version_update AFTER UPDATE ON recipes
+BEGIN UPDATE recipe_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS recipes_version_delete AFTER DELETE ON recipes
+BEGIN UPDATE recipe_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS recipe_items_version_insert AFTER INSERT ON recipe_items
+BEGIN UPDATE recipe_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS recipe_items_version_update AFTER UPDATE ON recipe_items
+BEGIN UPDATE recipe_version SET version = version + 1 WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS recipe_items_version_delete AFTER DELETE ON recipe_items
+BEGIN UPDATE recipe_version SET version = version + 1 WHERE id = 1; END;
+"""
+
+MAX_RECIPE_DEPTH = 32
+
+_RECIPE_LOCK = threading.Lock()
+_RECIPES_READY = set()
+_EXPLODED = {}
+
+
+def recipe_version(db_path):
+    # Return the recipe version stored in the database; triggers bump it on every recipe write.
+    ensure_recipes(db_path)
+    row = db_connection(db_path).execute("SELECT version FROM recipe_version WHERE id = 1").fetchone()
+    return row[0]
+
+
+def ensure_recipes(db_path):
+    # Create the recipe tables, seeding them from the built-in BOMs when empty.
+    if db_path in _RECIPES_READY:
+        return
+    conn = db_connection(db_path)
+    with conn:
+        conn.executescript(RECIPE_SCHEMA)
+        if conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0] == 0:
+            now = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+            for name, recipe in BOM_PER_UNIT.items():
+                conn.execute(
+                    "INSERT INTO recipes (name, labor_hours, is_product, updated_at) VALUES (?, ?, 1, ?)",
+                    (name, recipe["labor_hours"], now),
+                )
+                conn.executemany(
+                    "INSERT INTO recipe_items (recipe, position, material, unit, qty) VALUES (?, ?, ?, ?, ?)",
+                    [(name, pos, m["name"], m["unit"], m["qty"]) for pos, m in enumerate(recipe["materials"])],
+                )
+    with _RECIPE_LOCK:
+        _RECIPES_READY.add(db_path)
+
+
+def load_recipe_rows(conn):
+    # Read every recipe and its items in two queries.
+    recipes = conn.execute("SELECT * FROM recipes ORDER BY rowid").fetchall()
+    items = conn.execute("SELECT * FROM recipe_items ORDER BY recipe, position, id").fetchall()
+    by_recipe = {row["name"]: {"row": dict(row), "items": []} for row in recipes}
+    for item in items:
+        if item["recipe"] in by_recipe:
+            by_recipe[item["recipe"]]["items"].append(dict(item))
+    return by_recipe
+
+
+def explode_recipe(recipes, name):
+    # Flatten a recipe tree into per-unit material lines and labor hours.
+    totals = {}
+    labor = [0.0]
+
+    def walk(recipe_name, multiplier, path):
+        if recipe_name in path:
+            raise ValueError(f"Recipe cycle: {' -> '.join(path + (recipe_name,))}")
+        if len(path) >= MAX_RECIPE_DEPTH:
+            raise ValueError(f"Recipe {name} nests deeper than {MAX_RECIPE_DEPTH} levels")
+        recipe = recipes.get(recipe_name)
+        if recipe is None:
+            raise ValueError(f"Unknown recipe: {recipe_name}")
+        labor[0] += recipe["row"]["labor_hours"] * multiplier
+        for item in recipe["items"]:
+            if item["sub_recipe"] is not None:
+                walk(item["sub_recipe"], item["qty"] * multiplier, path + (recipe_name,))
+                continue
+            # Materials shared between sub-recipes merge into one line, in first-seen order.
+            key = (item["material"], item["unit"])
+            totals[key] = totals.get(key, 0.0) + item["qty"] * multiplier
+
+    walk(name, 1.0, ())
+    materials = [{"name": key[0], "unit": key[1], "qty": qty} for key, qty in totals.items()]
+    return materials, labor[0]
+
+
+def product_bom(db_path, job_type):
+    # Return the cached flattened BOM for a product, exploding its recipe tree again when the DB version changes.
+    version = recipe_version(db_path)
+    cached = _EXPLODED.get((db_path, job_type))
+    hit = cached is not None and cached["version"] == version
+    record_cache("recipe_bom", hit)
+    if hit:
+        return cached["bom"]
+    with _RECIPE_LOCK:
+        cached = _EXPLODED.get((db_path, job_type))
+        if cached is not None and cached["version"] == version:
+            return cached["bom"]
+        # The version was read before the rows, so a write landing in between only causes an extra explode.
+        recipes = load_recipe_rows(db_connection(db_path))
+        recipe = recipes.get(job_type)
+        if recipe is None or not recipe["row"]["is_product"]:
+            raise ValueError("Unknown job_type")
+        materials, labor_hours = explode_recipe(recipes, job_type)
+        bom = CompiledBom(job_type, materials, labor_hours)
+        _EXPLODED[(db_path, job_type)] = {"bom": bom, "version": version}
+    return bom
+
+
+def list_products(db_path):
+    # Names of the recipes sold as job types, in creation order.
+    ensure_recipes(db_path)
+    rows = db_connection(db_path).execute("SELECT name FROM recipes WHERE is_product = 1 ORDER BY rowid").fetchall()
+    return [row["name"] for row in rows]
+
+
+def list_recipes(db_path):
+    # Every recipe with its direct items, for the admin view.
+    ensure_recipes(db_path)
+    recipes = load_recipe_rows(db_connection(db_path))
+    result = []
+    for name, recipe in recipes.items():
+        row = recipe["row"]
+        result.append(
+            {
+                "name": name,
+                "labor_hours": row["labor_hours"],
+                "is_product": bool(row["is_product"]),
+                "updated_at": row["updated_at"],
+                "items": [
+                    {"recipe": item["sub_recipe"], "qty": item["qty"]}
+                    if item["sub_recipe"] is not None
+                    else {"material": item["material"], "unit": item["unit"], "qty": item["qty"]}
+                    for item in recipe["items"]
+                ],
+            }
+        )
+    return result
+
+
+def save_recipe(db_path, name, items, labor_hours=0.0, is_product=True):
+    # Create or replace a recipe; items are {"material", "unit", "qty"} or {"recipe", "qty"} dicts.
+    ensure_recipes(db_path)
+    if name is not None and not isinstance(name, str):
+        raise ValueError("Recipe name must be a string")
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Recipe name is required")
+    if labor_hours < 0:
+        raise ValueError("labor_hours must be >= 0")
+    rows = []
+    for pos, item in enumerate(items):
+        for field in ("recipe", "material", "unit"):
+            if item.get(field) is not None and not isinstance(item[field], str):
+                raise ValueError(f"Recipe item {field} must be a string")
+        qty = float(item.get("qty", 0))
+        if not qty > 0:
+            raise ValueError("Recipe item qty must be > 0")
+        if item.get("recipe"):
+            rows.append((name, pos, None, item["recipe"], None, qty))
+        elif item.get("material") and item.get("unit"):
+            rows.append((name, pos, item["material"], None, item["unit"], qty))
+        else:
+            raise ValueError("Each recipe item needs a material and unit, or a sub-recipe")
+    if not rows:
+        raise ValueError("A recipe needs at least one item")
+    conn = db_connection(db_path)
+    with conn:
+        stocked = {row["name"]: row["unit"] for row in conn.execute("SELECT name, unit FROM materials")}
+        unknown = sorted({row[2] for row in rows if row[2] is not None and row[2] not in stocked})
+        if unknown:
+            raise ValueError(f"Unknown materials: {', '.join(unknown)}")
+        # Reject units that can't convert to the catalog unit now, rather than failing every quote later.
+        for _, _, material, _, unit, _ in rows:
+            if material is None:
+                continue
+            try:
+                conversion_factor(unit, stocked[material])
+            except ValueError:
+                raise ValueError(f"{material} is stocked in {stocked[material]}; cannot use {unit}")
+        now = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+        conn.execute(
+            "INSERT INTO recipes (name, labor_hours, is_product, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET labor_hours = excluded.labor_hours, "
+            "is_product = excluded.is_product, updated_at = excluded.updated_at",
+            (name, float(labor_hours), 1 if is_product else 0, now),
+        )
+        conn.execute("DELETE FROM recipe_items WHERE recipe = ?", (name,))
+        conn.executemany(
+            "INSERT INTO recipe_items (recipe, position, material, sub_recipe, unit, qty) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        # Explode every recipe inside the transaction so a cycle or dangling sub-recipe rolls the save back.
+        recipes = load_recipe_rows(conn)
+        for recipe_name in recipes:
+            explode_recipe(recipes, recipe_name)
@@ -0,0 +1,237 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from pricing import DEFAULTS, append_rows_to_sheet, env_float, env_int, env_str
+
+
+_SINK_LOCK = threading.Lock()
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_QUEUED = queue.Queue()
+_PENDING = []
+_STATE = {"thread": None, "loaded_path": None, "oldest_at": None}
+
+
+def spool_path():
+    # Location of the on-disk row buffer (SHEETS_SPOOL_PATH, default OUTPUT_DIR/sheet_spool.jsonl).
+    default = os.path.join(env_str("OUTPUT_DIR", DEFAULTS["output_dir"]), "sheet_spool.jsonl")
+    return env_str("SHEETS_SPOOL_PATH", default)
+
+
+def dead_letter_path():
+    # Where rows rejected by the Sheets API go (SHEETS_DEAD_LETTER_PATH, default OUTPUT_DIR/sheet_dead_letter.jsonl).
+    default = os.path.join(env_str("OUTPUT_DIR", DEFAULTS["output_dir"]), "sheet_dead_letter.jsonl")
+    return env_str("SHEETS_DEAD_LETTER_PATH", default)
+
+
+def flush_rows_limit():
+    # Number of buffered rows that triggers an immediate flush.
+    return max(1, env_int("SHEETS_FLUSH_ROWS", 50))
+
+
+def flush_seconds():
+    # Longest time a row waits in the buffer before being flushed.
+    return max(0.1, env_float("SHEETS_FLUSH_SECONDS", 10.0))
+
+
+def load_spool(path):
+    # Pull rows left on disk by an earlier process into the in-memory buffer.
+    if _STATE["loaded_path"] == path:
+        return
+    _STATE["loaded_path"] = path
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return
+    for line in lines:
+        try:
+            _PENDING.append(json.loads(line))
+        except json.JSONDecodeError:
+            # A crash mid-write can leave a torn last line; drop it.
+            continue
+    if _PENDING and _STATE["oldest_at"] is None:
+        _STATE["oldest_at"] = time.time()
+
+
+def rewrite_spool(path):
+    # Replace the spool file with whatever is still buffered in memory.
+    if not _PENDING:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in _PENDING:
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_path, path)
+
+
+def queue_sheet_row(settings, headers, row):
+    # Hand a row to the flusher thread, which spools and sends it, so the caller never touches the disk.
+    _QUEUED.put(json.dumps({"settings": dict(settings), "headers": list(headers), "row": list(row)}, default=str))
+    start_sheet_flusher()
+    _WAKE.set()
+
+
+def spool_queued_rows():
+    # Move rows handed over by queue_sheet_row onto the spool file and into the buffer; flusher thread only.
+    lines = []
+    while True:
+        try:
+            lines.append(_QUEUED.get_nowait())
+        except queue.Empty:
+            break
+    path = spool_path()
+    with _SINK_LOCK:
+        load_spool(path)
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        _PENDING.extend(json.loads(line) for line in lines)
+        if _STATE["oldest_at"] is None:
+            _STATE["oldest_at"] = time.time()
+
+
+def pending_sheet_rows():
+    # Count rows waiting to be written to the sheet.
+    return len(_PENDING) + _QUEUED.qsize()
+
+
+def permanent_sheet_error(exc):
+    # True when retrying cannot help: the Sheets API rejected the request with a 4xx other than 408 or 429.
+    try:
+        status = int(getattr(getattr(exc, "resp", None), "status", None))
+    except (TypeError, ValueError):
+        return False
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+def dead_letter_rows(entries, exc):
+    # Set rejected rows aside with the error, so they can be fixed and replayed without blocking the rest.
+    path = dead_letter_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    failed_at = time.time()
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(dict(entry, error=f"{exc.__class__.__name__}: {exc}", failed_at=failed_at)) + "\n")
+    print(f"[sheets] {len(entries)} rows rejected by the Sheets API moved to {path}: {exc!r}")
+
+
+def flush_sheet_rows():
+    # Send every buffered row, one values.append per sheet; rows stay buffered while the API is unavailable.
+    spool_queued_rows()
+    with _SINK_LOCK:
+        batch = list(_PENDING)
+    if not batch:
+        return 0
+    sent = 0
+    done = 0
+    try:
+        while done < len(batch):
+            first = batch[done]
+            group = [first]
+            for entry in batch[done + 1 :]:
+                if entry["settings"] != first["settings"] or entry["headers"] != first["headers"]:
+                    break
+                group.append(entry)
+            try:
+                append_rows_to_sheet(first["settings"], first["headers"], [entry["row"] for entry in group])
+            except Exception as exc:
+                if not permanent_sheet_error(exc):
+                    raise
+                if len(group) == 1:
+                    dead_letter_rows(group, exc)
+                    done += 1
+                    continue
+                # Send the rejected group one row at a time so only the bad rows are set aside.
+                for entry in group:
+                    try:
+                        append_rows_to_sheet(entry["settings"], entry["headers"], [entry["row"]])
+                        sent += 1
+                    except Exception as row_exc:
+                        if not permanent_sheet_error(row_exc):
+                            raise
+                        dead_letter_rows([entry], row_exc)
+                    done += 1
+                continue
+            sent += len(group)
+            done += len(group)
+    finally:
+        if done:
+            with _SINK_LOCK:
+                del _PENDING[:done]
+                _STATE["oldest_at"] = time.time() if _PENDING else None
+                rewrite_spool(spool_path())
+    return sent
+
+
+def sheet_flusher():
+    # Flush the buffer every SHEETS_FLUSH_SECONDS, or sooner once SHEETS_FLUSH_ROWS rows are waiting.
+    failures = 0
+    retry_at = 0.0
+    while not _STOP.is_set():
+        _WAKE.clear()
+        try:
+            spool_queued_rows()
+        except OSError as exc:
+            print(f"[sheets] could not spool queued rows: {exc!r}")
+        with _SINK_LOCK:
+            count = len(_PENDING)
+            oldest_at = _STATE["oldest_at"]
+        interval = flush_seconds()
+        now = time.time()
+        if count and now >= retry_at and (count >= flush_rows_limit() or now - oldest_at >= interval):
+            try:
+                flush_sheet_rows()
+                failures = 0
+            except Exception as exc:
+                failures += 1
+                print(f"[sheets] flush of {count} rows failed (attempt {failures}): {exc!r}")
+                # Back off while the Sheets API is unavailable; new rows are still spooled to disk meanwhile.
+                retry_at = time.time() + interval * min(2 ** failures, 32)
+            continue
+        due = interval if oldest_at is None else oldest_at + interval - now
+        _WAKE.wait(max(0.05, due, retry_at - now))
+
+
+def start_sheet_flusher():
+    # Start the flusher thread once per process.
+    thread = _STATE["thread"]
+    if thread is not None and thread.is_alive():
+        return
+    with _SINK_LOCK:
+        thread = _STATE["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        _STOP.clear()
+        thread = threading.Thread(target=sheet_flusher, name="sheet-flusher", daemon=True)
+        _STATE["thread"] = thread
+        thread.start()
+
+
+def stop_sheet_flusher(timeout=10):
+    # Stop the flusher and make a last attempt to send what is buffered.
+    _STOP.set()
+    _WAKE.set()
+    with _SINK_LOCK:
+        thread, _STATE["thread"] = _STATE["thread"], None
+    if thread is not None:
+        thread.join(timeout)
+    try:
+        flush_sheet_rows()
+    except Exception as exc:
+        print(f"[sheets] final flush failed, rows kept in {spool_path()}: {exc!r}")
+
+
+def resume_sheet_sink():
+    # Restart the flusher at startup when an earlier process left rows on disk; it loads them itself.
+    if os.path.exists(spool_path()):
+        start_sheet_flusher()
@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+import weakref
+
+from env_settings import env_int
+
+
+_POOL_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_OPEN = []
+_STATE = {"generation": 0}
+
+
+def open_connection(db_path):
+    # Open a tuned connection: WAL so readers never wait on a writer, NORMAL sync, a larger page cache.
+    conn = sqlite3.connect(
+        db_path,
+        timeout=30,
+        check_same_thread=False,
+        cached_statements=env_int("SQLITE_STATEMENT_CACHE", 256),
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{env_int('SQLITE_CACHE_KB', 8192)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def db_connection(db_path):
+    # Return this thread's pooled connection for a database, opening it on first use.
+    conns = getattr(_LOCAL, "conns", None)
+    if conns is None or _LOCAL.generation != _STATE["generation"]:
+        conns = _LOCAL.conns = {}
+        _LOCAL.generation = _STATE["generation"]
+    conn = conns.get(db_path)
+    if conn is not None:
+        return conn
+    conn = open_connection(db_path)
+    conns[db_path] = conn
+    with _POOL_LOCK:
+        # Connections of threads that have exited are closed here rather than leaked.
+        alive = []
+        for owner, pooled in _OPEN:
+            if owner() is None or not owner().is_alive():
+                pooled.close()
+            else:
+                alive.append((owner, pooled))
+        alive.append((weakref.ref(threading.current_thread()), conn))
+        _OPEN[:] = alive
+    return conn
+
+
+def close_db_connections():
+    # Close every pooled connection at shutdown.
+    with _POOL_LOCK:
+        pooled, _OPEN[:] = list(_OPEN), []
+        # Other threads notice the new generation and reopen instead of using a closed handle.
+        _STATE["generation"] += 1
+    for _, conn in pooled:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
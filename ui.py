@@ -1,16 +1,39 @@
 from fastapi import FastAPI
 
+from email_outbox import resume_email_outbox, stop_email_workers
+from http_client import close_async_http_clients, close_http_clients
+from llm_telemetry import stop_llm_log_writer
+from pricing import install_config_reload_signal
+from quote_jobs import shutdown_pdf_pool
+from sheet_sink import resume_sheet_sink, stop_sheet_flusher
+from sqlite_pool import close_db_connections
 from ui_routes_admin import router as admin_router
 from ui_routes_assets import router as assets_router
 from ui_routes_chat import router as chat_router
+from ui_routes_metrics import RequestMetricsMiddleware
+from ui_routes_metrics import router as metrics_router
 from ui_routes_public import router as public_router
+from ui_routes_quotes import router as quotes_router
 
 
 app = FastAPI(title="Bakery Quotation UI")
+app.add_middleware(RequestMetricsMiddleware)
 app.include_router(public_router)
 app.include_router(admin_router)
 app.include_router(assets_router)
 app.include_router(chat_router)
+app.include_router(quotes_router)
+app.include_router(metrics_router)
+app.add_event_handler("startup", install_config_reload_signal)
+app.add_event_handler("startup", resume_email_outbox)
+app.add_event_handler("startup", resume_sheet_sink)
+app.add_event_handler("shutdown", shutdown_pdf_pool)
+app.add_event_handler("shutdown", stop_email_workers)
+app.add_event_handler("shutdown", stop_sheet_flusher)
+app.add_event_handler("shutdown", close_db_connections)
+app.add_event_handler("shutdown", close_http_clients)
+app.add_event_handler("shutdown", close_async_http_clients)
+app.add_event_handler("shutdown", stop_llm_log_writer)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,44 @@
+import codecs
+import csv
+import json
 import math
 import os
 
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 
-from pricing import get_defaults, list_materials, update_material_cost
+from llm_telemetry import llm_usage
+from pricing import (
+    MAX_BULK_PRICE_ROWS,
+    bulk_update_material_costs,
+    get_defaults,
+    get_material,
+    list_materials,
+    material_catalog,
+    material_price_history,
+    reload_config,
+    update_material_cost,
+)
+from recipes import list_recipes, save_recipe
 from ui_utils import ADMIN_COOKIE_NAME, admin_cookie_valid, admin_token
 
 
 router = APIRouter()
 
+MAX_BULK_ERRORS = 50
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+def parse_unit_cost(value):
+    # Parse an admin-supplied price, rejecting negative and non-finite values.
+    try:
+        unit_cost = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid unit_cost")
+    if not math.isfinite(unit_cost) or unit_cost < 0:
+        raise ValueError("unit_cost must be a non-negative number")
+    return unit_cost
+
 
 @router.post("/admin/login")
 async def admin_login(request: Request):
@@ -38,6 +67,26 @@ async def admin_logout():
     return response
 
 
+@router.get("/admin/llm/usage")
+def admin_llm_usage(request: Request, limit: int = 50):
+    # LLM calls, tokens, wall time and cost per route and for the most recently active chat sessions.
+    if not admin_cookie_valid(request):
+        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    return JSONResponse({"ok": True, **llm_usage(max(1, min(limit, 1000)))})
+
+
+@router.post("/admin/config/reload")
+def admin_reload_config(request: Request):
+    # Re-read .env and the environment into a new settings snapshot.
+    if not admin_cookie_valid(request):
+        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    try:
+        snapshot = reload_config()
+    except ValueError as exc:
+        return JSONResponse({"ok": False, "error": str(exc)}, status_code=400)
+    return JSONResponse({"ok": True, "version": snapshot["version"]})
+
+
 @router.get("/admin/materials")
 def admin_materials(request: Request):
     # Return the full materials list for the admin panel.
@@ -47,6 +96,51 @@ def admin_materials(request: Request):
     return JSONResponse({"ok": True, "materials": list_materials(defaults["materials_db_path"])})
 
 
+@router.get("/admin/materials/{name}/history")
+def admin_material_history(name: str, request: Request):
+    # Return every recorded price for one material, oldest first.
+    if not admin_cookie_valid(request):
+        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    defaults = get_defaults()
+    if get_material(defaults["materials_db_path"], name) is None:
+        return JSONResponse({"ok": False, "error": "Material not found"}, status_code=404)
+    history = material_price_history(defaults["materials_db_path"], name)
+    return JSONResponse({"ok": True, "name": name, "history": history})
+
+
+@router.get("/admin/recipes")
+def admin_recipes(request: Request):
+    # Return every recipe and sub-recipe with its direct items.
+    if not admin_cookie_valid(request):
+        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    defaults = get_defaults()
+    return JSONResponse({"ok": True, "recipes": list_recipes(defaults["materials_db_path"])})
+
+
+@router.post("/admin/recipes")
+async def admin_save_recipe(request: Request):
+    # Create or replace a recipe; products become quotable job types immediately.
+    if not admin_cookie_valid(request):
+        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    payload = await request.json()
+    if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+        return JSONResponse({"ok": False, "error": "items must be a list"}, status_code=400)
+    if not all(isinstance(item, dict) for item in payload["items"]):
+        return JSONResponse({"ok": False, "error": "Each item must be an object"}, status_code=400)
+    defaults = get_defaults()
+    try:
+        save_recipe(
+            defaults["materials_db_path"],
+            payload.get("name"),
+            payload["items"],
+            labor_hours=float(payload.get("labor_hours") or 0),
+            is_product=bool(payload.get("is_product", True)),
+        )
+    except (TypeError, ValueError) as exc:
+        return JSONResponse({"ok": False, "error": str(exc)}, status_code=400)
+    return JSONResponse({"ok": True})
+
+
 @router.post("/admin/materials/update")
 async def admin_update_material(request: Request):
     # Update a single material price from the admin panel.
@@ -58,14 +152,157 @@ async def admin_update_material(request: Request):
     if not name:
         return JSONResponse({"ok": False, "error": "Missing material name"}, status_code=400)
     try:
-        unit_cost = float(unit_cost)
-    except (TypeError, ValueError):
-        return JSONResponse({"ok": False, "error": "Invalid unit_cost"}, status_code=400)
-    if not math.isfinite(unit_cost) or unit_cost < 0:
-        return JSONResponse({"ok": False, "error": "unit_cost must be a non-negative number"}, status_code=400)
+        unit_cost = parse_unit_cost(unit_cost)
+    except ValueError as exc:
+        return JSONResponse({"ok": False, "error": str(exc)}, status_code=400)
     defaults = get_defaults()
     try:
         update_material_cost(defaults["materials_db_path"], name, unit_cost)
     except ValueError as exc:
         return JSONResponse({"ok": False, "error": str(exc)}, status_code=404)
     return JSONResponse({"ok": True})
+
+
+async def upload_chunks(request):
+    # Yield the raw upload bytes: the multipart "file" field, or the request body itself.
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "read"):
+            raise ValueError("Upload the price list in a 'file' field")
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        async for chunk in request.stream():
+            yield chunk
+
+
+async def upload_lines(request):
+    # Decode the upload into text lines as it arrives.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in upload_chunks(request):
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+async def with_first_line(first, lines):
+    # Put a peeked line back in front of the rest of the upload.
+    yield first
+    async for line in lines:
+        yield line
+
+
+def opens_json_document(line):
+    # True if an upload's first line starts a JSON array or a {"materials": [...]} object rather than an NDJSON row.
+    text = line.strip()
+    if text.startswith("["):
+        return True
+    if not text.startswith("{"):
+        return False
+    try:
+        record = json.loads(text)
+    except json.JSONDecodeError:
+        # An object spread over several lines is a whole document.
+        return True
+    return isinstance(record, dict) and "materials" in record
+
+
+async def upload_records(request):
+    # Yield (row_number, record) pairs from a CSV, NDJSON or JSON-array price list.
+    # The format is sniffed from the first line, so a JSON file sent as a multipart part works like a JSON body.
+    content_type = request.headers.get("content-type", "")
+    lines = upload_lines(request)
+    first = ""
+    async for line in lines:
+        if line.strip():
+            first = line
+            break
+    if ("json" in content_type and "ndjson" not in content_type) or opens_json_document(first):
+        # A JSON document has to be read whole before it can be parsed.
+        payload = json.loads("\n".join([first] + [line async for line in lines]).strip() or "null")
+        if isinstance(payload, dict):
+            payload = payload.get("materials")
+        if not isinstance(payload, list):
+            raise ValueError("JSON uploads must be a list of {name, unit_cost} objects")
+        for index, record in enumerate(payload, start=1):
+            yield index, record
+        return
+    header = None
+    row_number = 0
+    async for line in with_first_line(first, lines):
+        if not line.strip():
+            continue
+        if header is None and line.lstrip().startswith("{"):
+            header = "ndjson"
+        if header == "ndjson":
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except json.JSONDecodeError:
+                yield row_number, None
+            continue
+        cells = next(csv.reader([line]))
+        if header is None:
+            header = [cell.strip().lower() for cell in cells]
+            if "name" not in header or "unit_cost" not in header:
+                raise ValueError("CSV uploads need a header row with name and unit_cost columns")
+            continue
+        row_number += 1
+        yield row_number, dict(zip(header, cells))
+
+
+@router.post("/admin/materials/bulk")
+async def admin_bulk_update_materials(request: Request):
+    # Apply a CSV/JSON price list in one transaction; nothing is written if any row is invalid.
+    if not admin_cookie_valid(request):
+        return JSONResponse({"ok": False, "error": "Unauthorized"}, status_code=401)
+    defaults = get_defaults()
+    known = material_catalog(defaults["materials_db_path"])
+    prices = {}
+    errors = []
+    error_count = 0
+    rows = 0
+    try:
+        async for row_number, record in upload_records(request):
+            rows += 1
+            if rows > MAX_BULK_PRICE_ROWS:
+                return JSONResponse(
+                    {"ok": False, "error": f"Bulk updates are limited to {MAX_BULK_PRICE_ROWS} rows"},
+                    status_code=413,
+                )
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("Row must be an object with name and unit_cost")
+                name = str(record.get("name") or "").strip()
+                if not name:
+                    raise ValueError("Missing material name")
+                if name not in known:
+                    raise ValueError(f"Material not found: {name}")
+                prices[name] = parse_unit_cost(record.get("unit_cost"))
+            except ValueError as exc:
+                error_count += 1
+                if len(errors) < MAX_BULK_ERRORS:
+                    errors.append({"row": row_number, "error": str(exc)})
+    except (ValueError, UnicodeDecodeError) as exc:
+        return JSONResponse({"ok": False, "error": str(exc)}, status_code=400)
+    if error_count:
+        return JSONResponse(
+            {"ok": False, "error": f"{error_count} invalid rows; nothing was updated", "errors": errors},
+            status_code=400,
+        )
+    if not prices:
+        return JSONResponse({"ok": False, "error": "No rows to update"}, status_code=400)
+    try:
+        updated = bulk_update_material_costs(defaults["materials_db_path"], prices)
+    except ValueError as exc:
+        return JSONResponse({"ok": False, "error": str(exc)}, status_code=409)
+    return JSONResponse({"ok": True, "rows": rows, "updated": updated})
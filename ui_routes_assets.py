@@ -1,13 +1,21 @@
 import os
 
 from fastapi import APIRouter
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response
 
+from artifact_store import artifact_store
 from pricing import get_defaults
+from quote_jobs import ensure_artifact
 
 
 router = APIRouter()
 
+DOWNLOAD_MEDIA_TYPES = {
+    ".md": "text/markdown",
+    ".txt": "text/plain",
+    ".pdf": "application/pdf",
+}
+
 
 @router.get("/styles.css")
 def styles_css():
@@ -29,10 +37,20 @@ def vanta_waves_js():
 
 @router.get("/download/{filename}")
 def download(filename: str):
-    # Serve generated quote files from the output directory.
+    # Serve quote files from the artifact store, rendering the requested format on first access.
     defaults = get_defaults()
     safe_name = os.path.basename(filename)
-    path = os.path.join(defaults["output_dir"], safe_name)
-    if not os.path.exists(path):
+    stem, ext = os.path.splitext(safe_name)
+    data = None
+    if stem.startswith("quote_") and ext in DOWNLOAD_MEDIA_TYPES:
+        try:
+            data = ensure_artifact(artifact_store(defaults["output_dir"]), stem[len("quote_"):], ext.lstrip("."))
+        except Exception as exc:
+            print(f"[download] rendering {safe_name} failed: {exc!r}")
+    if data is None:
         return HTMLResponse("File not found", status_code=404)
-    return FileResponse(path, filename=safe_name, media_type="text/markdown")
+    return Response(
+        data,
+        media_type=DOWNLOAD_MEDIA_TYPES[ext],
+        headers={"Content-Disposition": f'attachment; filename="{safe_name}"'},
+    )
@@ -1,43 +1,59 @@
+import asyncio
 import datetime as dt
+import hashlib
 import json
 import os
 import re
-import urllib.error
-import urllib.request
+import time
+import uuid
 
+import httpx
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 
+from artifact_store import artifact_store
 from pricing import (
-    append_quote_to_sheet,
+    apply_quote_items,
     build_quote,
     compute_costs,
+    email_attachment_formats,
     fetch_job_types,
     get_defaults,
     get_material,
     list_materials,
     load_fx_rates,
+    mistral_settings,
     parse_pct,
+    project_summary,
     resend_settings,
-    send_quote_email,
-    send_quote_email_resend,
     sheets_settings,
     smtp_settings,
 )
+from email_outbox import email_state as outbox_email_state
+from email_outbox import enqueue_email
+from http_client import async_http_get_json, async_http_request
+from llm_telemetry import record_llm_call
+from metrics import timed_stage
+from quote_jobs import pdf_status
+from quote_memo import quote_fingerprint, quote_lock, recall_quote, recorded_quote_matches, remember_quote
+from sheet_sink import queue_sheet_row
 
 
 router = APIRouter()
 
 
-def mistral_chat(messages, tools=None, tool_choice=None):
-    # Send a chat completion request to Mistral.
-    api_key = os.environ.get("MISTRAL_API_KEY", "").strip()
-    if not api_key:
+def mistral_model():
+    # Model name sent to the Mistral API.
+    return mistral_settings()["model"]
+
+
+async def mistral_chat(messages, tools=None, tool_choice=None):
+    # Send a chat completion request to Mistral without blocking the event loop.
+    settings = mistral_settings()
+    if not settings["api_key"]:
         raise ValueError("MISTRAL_API_KEY is not configured")
-    base_url = os.environ.get("MISTRAL_BASE_URL", "https://api.mistral.ai/v1").rstrip("/")
-    model = os.environ.get("MISTRAL_MODEL", "mistral-large-latest")
     payload = {
-        "model": model,
+        "model": settings["model"],
         "messages": messages,
         "temperature": 0.2,
     }
@@ -45,35 +61,70 @@ def mistral_chat(messages, tools=None, tool_choice=None):
         payload["tools"] = tools
     if tool_choice:
         payload["tool_choice"] = tool_choice
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        f"{base_url}/chat/completions",
-        data=data,
-        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-    )
+    timeout = settings["timeout"]
+    # The async pool has its own, larger limit so concurrent chat turns wait on the model, not on connections.
+    max_connections = settings["max_connections"]
+    pool_timeout = settings["pool_timeout"]
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8")
-        raise RuntimeError(f"Mistral API error {exc.code}: {detail}")
-    except urllib.error.URLError as exc:
+        resp = await async_http_request(
+            "POST",
+            f"{settings['base_url']}/chat/completions",
+            timeout=timeout,
+            pool_timeout=pool_timeout,
+            pool="mistral",
+            max_connections=max_connections,
+            content=json.dumps(payload).encode("utf-8"),
+            headers={"Authorization": f"Bearer {settings['api_key']}", "Content-Type": "application/json"},
+        )
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"Mistral API timed out after {timeout:g}s")
+    except httpx.PoolTimeout:
+        raise RuntimeError(f"All {max_connections} Mistral connections busy for {pool_timeout:g}s")
+    except httpx.HTTPError as exc:
         raise RuntimeError(f"Mistral API unreachable: {exc}")
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Mistral API error {resp.status_code}: {resp.text}")
+    return resp.json()
+
+
+def chat_session_id(payload, messages):
+    # The client's session id, or a stable one derived from the conversation's first user message.
+    session_id = str(payload.get("session_id") or "").strip()[:64]
+    if session_id:
+        return session_id
+    first = next((str(m.get("content", "")) for m in messages if m.get("role") == "user"), "")
+    return "anon-" + hashlib.sha1(first.encode("utf-8")).hexdigest()[:12]
+
+
+async def traced_mistral_chat(trace, call, messages, **kwargs):
+    # Await mistral_chat, recording latency, token usage, tool calls and outcome for the turn.
+    started = time.perf_counter()
+    response = error = None
+    try:
+        response = await mistral_chat(messages, **kwargs)
+        return response
+    except asyncio.CancelledError:
+        error = "cancelled"
+        raise
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        record_llm_call(**trace, call=call, model=mistral_model(), response=response, wall_seconds=elapsed, error=error)
 
 
-def fetch_london_date():
+async def fetch_london_date():
     # Get today's date for London from WorldTimeAPI.
     url = os.environ.get("WORLD_TIME_API_URL", "http://worldtimeapi.org/api/timezone/Europe/London")
-    req = urllib.request.Request(url, headers={"User-Agent": "bakery-quote-agent"})
-    with urllib.request.urlopen(req, timeout=10) as resp:
-        payload = json.loads(resp.read().decode("utf-8"))
+    payload = await async_http_get_json(url, timeout=10)
     dt_str = payload.get("datetime")
     if not dt_str:
         raise RuntimeError("WorldTimeAPI response missing datetime")
     return dt.date.fromisoformat(dt_str[:10])
 
 
-def resolve_due_date(text):
+async def resolve_due_date(text):
     # Resolve friendly date phrases into ISO dates when possible.
     if not text:
         return text
@@ -81,7 +132,7 @@ def resolve_due_date(text):
     if re.match(r"^\d{4}-\d{2}-\d{2}$", lowered):
         return lowered
     try:
-        today = fetch_london_date()
+        today = await fetch_london_date()
     except Exception:
         return text
     if "today" in lowered:
@@ -107,13 +158,13 @@ def resolve_due_date(text):
     return text
 
 
-def normalize_due_date_text(text, today):
+async def normalize_due_date_text(text, today):
     # Parse common date formats into ISO strings.
     if not text:
         return None
     cleaned = text.strip()
     lowered = cleaned.lower()
-    resolved = resolve_due_date(cleaned)
+    resolved = await resolve_due_date(cleaned)
     if resolved != cleaned:
         return resolved
 
@@ -211,7 +262,7 @@ def normalize_due_date_text(text, today):
     return None
 
 
-def validate_due_date_via_api(date_obj):
+async def validate_due_date_via_api(date_obj):
     # Use a public holiday API as a basic date sanity check.
     country = os.environ.get("DATE_VALIDATION_COUNTRY", "GB").strip() or "GB"
     url_template = os.environ.get(
@@ -219,10 +270,8 @@ def validate_due_date_via_api(date_obj):
         "https://date.nager.at/api/v3/publicholidays/{year}/{country}",
     )
     url = url_template.format(year=date_obj.year, country=country)
-    req = urllib.request.Request(url, headers={"User-Agent": "bakery-quote-agent"})
     try:
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            payload = json.loads(resp.read().decode("utf-8"))
+        payload = await async_http_get_json(url, timeout=5)
         return isinstance(payload, list)
     except Exception:
         return False
@@ -242,7 +291,7 @@ def validate_email_locally(email):
     return ok
 
 
-def validation_today():
+async def validation_today():
     # Pick a stable "today" reference for validation.
     override = os.environ.get("DATE_VALIDATION_TODAY", "").strip()
     if override:
@@ -251,7 +300,7 @@ def validation_today():
         except ValueError:
             pass
     try:
-        return fetch_london_date()
+        return await fetch_london_date()
     except Exception:
         return dt.date.today()
 
@@ -266,6 +315,8 @@ def chat_system_prompt(job_types, fx_rates):
         "Required fields: job_type, quantity, due_date, company_name, customer_name, "
         "customer_email, currency, vat_pct. "
         f"Valid job types: {', '.join(job_types)}. "
+        "If the customer orders several products at once, pass them as items "
+        "([{job_type, quantity}, ...]) so they get one combined quote. "
         "Use % values for markup and VAT when asking. "
         "Ask whether the customer wants to add any notes and whether they want the quote emailed. "
         "You can answer general questions too. "
@@ -374,12 +425,133 @@ def find_material_in_text(text, materials):
     return None
 
 
+def email_quote(inputs, defaults, result):
+    # Queue the quote email in the outbox; returns the outbox id, or None if email is not configured.
+    if resend_settings() is None and smtp_settings() is None:
+        return None
+    subject = f"Quotation {result['quote_id']} from {defaults['sender_name']}"
+    body = (
+        f"Hello {inputs['customer_name']},\n\n"
+        "Thank you for your order. Please find your quotation attached.\n\n"
+        f"Quote ID: {result['quote_id']}\n"
+        f"Project: {project_summary(inputs)}\n"
+        f"Due date: {inputs['due_date']}\n"
+        f"Total: {result['summary']['total']} {inputs['currency']}\n\n"
+        f"Regards,\n{defaults['sender_name']}\n"
+    )
+    return enqueue_email(result["quote_id"], inputs["customer_email"], subject, body, email_attachment_formats())
+
+
+def log_quote_to_sheet(inputs, result, email_state):
+    # Append a generated quote to the configured Google Sheet, if any.
+    sheet_settings = sheets_settings()
+    if sheet_settings is None:
+        return
+    headers = [
+        "timestamp",
+        "quote_id",
+        "quote_date",
+        "valid_until",
+        "company_name",
+        "customer_name",
+        "customer_email",
+        "job_type",
+        "quantity",
+        "due_date",
+        "currency",
+        "labor_rate",
+        "labor_hours",
+        "materials_subtotal",
+        "labor_cost",
+        "subtotal",
+        "markup_pct",
+        "markup_value",
+        "price_before_vat",
+        "vat_pct",
+        "vat_value",
+        "total",
+        "unit_price",
+        "notes",
+        "email_status",
+        "warnings",
+        "quote_md_path",
+        "quote_txt_path",
+        "line_items_json",
+    ]
+    row = [
+        result["quote_date"],
+        result["quote_id"],
+        result["quote_date"],
+        result["valid_until"],
+        inputs["company_name"],
+        inputs["customer_name"],
+        inputs["customer_email"],
+        inputs["job_type"],
+        inputs["quantity"],
+        inputs["due_date"],
+        inputs["currency"],
+        inputs["labor_rate"],
+        result["summary"]["labor_hours"],
+        result["summary"]["materials_subtotal"],
+        result["summary"]["labor_cost"],
+        result["summary"]["subtotal"],
+        f"{inputs['markup_pct']*100:.0f}%",
+        result["summary"]["markup_value"],
+        result["summary"]["price_before_vat"],
+        f"{inputs['vat_pct']*100:.0f}%",
+        result["summary"]["vat_value"],
+        result["summary"]["total"],
+        result["summary"].get("unit_price", ""),
+        inputs["notes"],
+        email_state,
+        ", ".join(result["warnings"]),
+        result["out_path"],
+        result["out_txt_path"],
+        json.dumps(result["lines"]),
+    ]
+    try:
+        queue_sheet_row(sheet_settings, headers, row)
+    except Exception:
+        pass
+
+
+async def generate_quote_once(inputs, defaults, send_email):
+    # Build, email and log a confirmed quote; identical repeats reuse the first result.
+    quote_key = quote_fingerprint(inputs, defaults)
+    store = artifact_store(defaults["output_dir"])
+    async with quote_lock(quote_key):
+        memo = recall_quote(quote_key)
+        # The fingerprint covers customer_email, so a verified hit can only ever email the same recipient.
+        if memo is not None and recorded_quote_matches(store, memo["result"]["quote_id"], quote_key):
+            result = memo["result"]
+            outbox_id = memo["outbox_id"]
+            email_state = memo["email_state"] if outbox_id is None else outbox_email_state(outbox_id)
+            fresh = False
+        else:
+            with timed_stage("compute_costs"):
+                lines, summary = compute_costs(inputs, defaults)
+            result = build_quote(inputs, defaults, lines=lines, summary=summary, store=store, fingerprint=quote_key)
+            outbox_id = None
+            email_state = "skipped"
+            fresh = True
+        if send_email and email_state not in ("queued", "sending", "sent"):
+            with timed_stage("email_enqueue"):
+                outbox_id = email_quote(inputs, defaults, result)
+            email_state = "not_configured" if outbox_id is None else "queued"
+        if fresh:
+            with timed_stage("sheet_queue"):
+                log_quote_to_sheet(inputs, result, email_state)
+        remember_quote(quote_key, result, email_state, outbox_id)
+    return result, email_state
+
+
 @router.post("/api/chat")
 async def chat_api(request: Request):
     # Orchestrate the chat flow and optional quote generation.
     payload = await request.json()
     messages = payload.get("messages", [])
     send_email = False
+    trace = {"route": "/api/chat", "session_id": chat_session_id(payload, messages), "turn_id": uuid.uuid4().hex[:12]}
 
     defaults = get_defaults()
     job_types = fetch_job_types() or ["cupcakes", "cake", "pastry_box"]
@@ -392,8 +564,8 @@ async def chat_api(request: Request):
     user_text = last_user_message(messages)
     assistant_text = last_assistant_message(messages)
     if user_text and assistant_text and assistant_requested_due_date(assistant_text):
-        today = validation_today()
-        normalized = normalize_due_date_text(user_text, today)
+        today = await validation_today()
+        normalized = await normalize_due_date_text(user_text, today)
         if normalized:
             try:
                 normalized_date = dt.date.fromisoformat(normalized)
@@ -408,7 +580,7 @@ async def chat_api(request: Request):
                             )
                         }
                     )
-                if not validate_due_date_via_api(normalized_date):
+                if not await validate_due_date_via_api(normalized_date):
                     return JSONResponse(
                         {
                             "reply": (
@@ -476,6 +648,17 @@ async def chat_api(request: Request):
                     "properties": {
                         "job_type": {"type": "string"},
                         "quantity": {"type": "integer"},
+                        "items": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "job_type": {"type": "string"},
+                                    "quantity": {"type": "integer"},
+                                },
+                                "required": ["job_type", "quantity"],
+                            },
+                        },
                         "due_date": {"type": "string"},
                         "company_name": {"type": "string"},
                         "customer_name": {"type": "string"},
@@ -489,8 +672,6 @@ async def chat_api(request: Request):
                         "confirm": {"type": "boolean"},
                     },
                     "required": [
-                        "job_type",
-                        "quantity",
                         "due_date",
                         "company_name",
                         "customer_name",
@@ -531,19 +712,30 @@ async def chat_api(request: Request):
                     "properties": {
                         "job_type": {"type": "string"},
                         "quantity": {"type": "integer"},
+                        "items": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "job_type": {"type": "string"},
+                                    "quantity": {"type": "integer"},
+                                },
+                                "required": ["job_type", "quantity"],
+                            },
+                        },
                         "currency": {"type": "string"},
                         "labor_rate": {"type": "number"},
                         "markup_pct": {"type": "number"},
                         "vat_pct": {"type": "number"},
                     },
-                    "required": ["job_type", "quantity", "currency"],
+                    "required": ["currency"],
                 },
             },
         },
     ]
 
     try:
-        resp = mistral_chat([system] + messages, tools=tools, tool_choice="auto")
+        resp = await traced_mistral_chat(trace, "initial", [system] + messages, tools=tools, tool_choice="auto")
         msg = resp["choices"][0]["message"]
     except Exception as exc:
         return JSONResponse({"reply": f"Error: {exc}"}, status_code=200)
@@ -586,13 +778,14 @@ async def chat_api(request: Request):
                 inputs = {
                     "job_type": args.get("job_type"),
                     "quantity": quantity,
+                    "items": args.get("items"),
                     "currency": args.get("currency", defaults["currency"]),
                     "labor_rate": float(args.get("labor_rate", defaults["labor_rate"])),
                     "markup_pct": parse_pct(float(args.get("markup_pct", defaults["markup_pct"] * 100))),
                     "vat_pct": parse_pct(float(args.get("vat_pct", defaults["vat_pct"] * 100))),
                 }
                 try:
-                    lines, summary = compute_costs(inputs, defaults)
+                    lines, summary = compute_costs(apply_quote_items(inputs), defaults)
                     content = {"summary": summary, "lines": lines}
                 except Exception as exc:
                     content = {"error": str(exc)}
@@ -607,10 +800,11 @@ async def chat_api(request: Request):
                     quantity = int(qty_raw)
                 except (TypeError, ValueError):
                     quantity = 0
-                resolved_due = resolve_due_date(args.get("due_date", ""))
+                resolved_due = await resolve_due_date(args.get("due_date", ""))
                 inputs = {
                     "job_type": args.get("job_type"),
                     "quantity": quantity,
+                    "items": args.get("items"),
                     "due_date": resolved_due or "TBD",
                     "company_name": args.get("company_name", "Bakery Co."),
                     "customer_name": args.get("customer_name", "Customer"),
@@ -623,20 +817,38 @@ async def chat_api(request: Request):
                 }
                 send_email = bool(args.get("send_email", False))
                 confirmed = bool(args.get("confirm", False))
-
                 try:
-                    lines, summary = compute_costs(inputs, defaults)
-                except Exception as exc:
+                    apply_quote_items(inputs)
+                except ValueError as exc:
                     tool_messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool["id"],
-                            "content": json.dumps({"error": str(exc)}),
-                        }
+                        {"role": "tool", "tool_call_id": tool["id"], "content": json.dumps({"error": str(exc)})}
                     )
                     continue
 
-                if not confirmed:
+                if confirmed:
+                    try:
+                        result, email_state = await generate_quote_once(inputs, defaults, send_email)
+                    except Exception as exc:
+                        tool_messages.append(
+                            {
+                                "role": "tool",
+                                "tool_call_id": tool["id"],
+                                "content": json.dumps({"error": str(exc)}),
+                            }
+                        )
+                        continue
+                else:
+                    try:
+                        lines, summary = compute_costs(inputs, defaults)
+                    except Exception as exc:
+                        tool_messages.append(
+                            {
+                                "role": "tool",
+                                "tool_call_id": tool["id"],
+                                "content": json.dumps({"error": str(exc)}),
+                            }
+                        )
+                        continue
                     preview_payload = {
                         "summary": summary,
                         "currency": inputs["currency"],
@@ -659,116 +871,6 @@ async def chat_api(request: Request):
                     )
                     continue
 
-                result = build_quote(inputs, defaults, lines=lines, summary=summary)
-
-                email_state = "skipped"
-                if send_email:
-                    resend = resend_settings()
-                    settings = smtp_settings()
-                    if resend is None and settings is None:
-                        email_state = "not_configured"
-                    else:
-                        subject = f"Quotation {result['quote_id']} from {defaults['sender_name']}"
-                        body = (
-                            f"Hello {inputs['customer_name']},\n\n"
-                            "Thank you for your order. Please find your quotation attached.\n\n"
-                            f"Quote ID: {result['quote_id']}\n"
-                            f"Project: {inputs['job_type']} x {inputs['quantity']}\n"
-                            f"Due date: {inputs['due_date']}\n"
-                            f"Total: {result['summary']['total']} {inputs['currency']}\n\n"
-                            f"Regards,\n{defaults['sender_name']}\n"
-                        )
-                        try:
-                            if resend is not None:
-                                send_quote_email_resend(
-                                    resend,
-                                    inputs["customer_email"],
-                                    subject,
-                                    body,
-                                    [result["out_path"], result["out_txt_path"], result["out_pdf_path"]],
-                                )
-                            else:
-                                send_quote_email(
-                                    settings,
-                                    inputs["customer_email"],
-                                    subject,
-                                    body,
-                                    [result["out_path"], result["out_txt_path"], result["out_pdf_path"]],
-                                )
-                            email_state = "sent"
-                        except Exception as exc:
-                            print(f"[email] send failed: {exc!r}")
-                            email_state = f"failed: {exc.__class__.__name__}: {exc}"
-
-                sheet_settings = sheets_settings()
-                if sheet_settings is not None:
-                    headers = [
-                        "timestamp",
-                        "quote_id",
-                        "quote_date",
-                        "valid_until",
-                        "company_name",
-                        "customer_name",
-                        "customer_email",
-                        "job_type",
-                        "quantity",
-                        "due_date",
-                        "currency",
-                        "labor_rate",
-                        "labor_hours",
-                        "materials_subtotal",
-                        "labor_cost",
-                        "subtotal",
-                        "markup_pct",
-                        "markup_value",
-                        "price_before_vat",
-                        "vat_pct",
-                        "vat_value",
-                        "total",
-                        "unit_price",
-                        "notes",
-                        "email_status",
-                        "warnings",
-                        "quote_md_path",
-                        "quote_txt_path",
-                        "line_items_json",
-                    ]
-                    row = [
-                        result["quote_date"],
-                        result["quote_id"],
-                        result["quote_date"],
-                        result["valid_until"],
-                        inputs["company_name"],
-                        inputs["customer_name"],
-                        inputs["customer_email"],
-                        inputs["job_type"],
-                        inputs["quantity"],
-                        inputs["due_date"],
-                        inputs["currency"],
-                        inputs["labor_rate"],
-                        result["summary"]["labor_hours"],
-                        result["summary"]["materials_subtotal"],
-                        result["summary"]["labor_cost"],
-                        result["summary"]["subtotal"],
-                        f"{inputs['markup_pct']*100:.0f}%",
-                        result["summary"]["markup_value"],
-                        result["summary"]["price_before_vat"],
-                        f"{inputs['vat_pct']*100:.0f}%",
-                        result["summary"]["vat_value"],
-                        result["summary"]["total"],
-                        result["summary"]["unit_price"],
-                        inputs["notes"],
-                        email_state,
-                        ", ".join(result["warnings"]),
-                        result["out_path"],
-                        result["out_txt_path"],
-                        json.dumps(result["lines"]),
-                    ]
-                    try:
-                        append_quote_to_sheet(sheet_settings, headers, row)
-                    except Exception:
-                        pass
-
                 tool_result = {
                     "quote_id": result["quote_id"],
                     "total": result["summary"]["total"],
@@ -792,6 +894,7 @@ async def chat_api(request: Request):
                     "md_filename": os.path.basename(result["out_path"]),
                     "txt_filename": os.path.basename(result["out_txt_path"]),
                     "pdf_filename": os.path.basename(result["out_pdf_path"]),
+                    "pdf_status": pdf_status(result["quote_id"], artifact_store(defaults["output_dir"]))["status"],
                 }
 
         if preview_payload and not quote_payload:
@@ -806,16 +909,17 @@ async def chat_api(request: Request):
                 f"- Price before VAT: {summary['price_before_vat']} {currency}",
                 f"- VAT ({preview_payload['vat_pct']*100:.0f}%): {summary['vat_value']} {currency}",
                 f"- Total: {summary['total']} {currency}",
-                f"- Unit price: {summary['unit_price']} {currency}",
-                "Reply 'confirm' to generate the quote.",
             ]
+            if "unit_price" in summary:
+                reply_lines.append(f"- Unit price: {summary['unit_price']} {currency}")
+            reply_lines.append("Reply 'confirm' to generate the quote.")
             if preview_payload["warnings"]:
                 reply_lines.append("Warnings:")
                 reply_lines.extend(f"- {warning}" for warning in preview_payload["warnings"])
             return JSONResponse({"reply": "\n".join(reply_lines)})
 
         try:
-            follow = mistral_chat([system] + messages + [msg] + tool_messages)
+            follow = await traced_mistral_chat(trace, "follow_up", [system] + messages + [msg] + tool_messages)
             reply = follow["choices"][0]["message"]["content"]
         except Exception:
             reply = "Done. Let me know if you need anything else."
@@ -0,0 +1,59 @@
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from email_outbox import outbox_depth
+from metrics import increment, observe, register_gauge, render_metrics
+from quote_jobs import pending_pdf_renders
+from sheet_sink import pending_sheet_rows
+
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def queue_depths():
+    # Work waiting in each background queue.
+    return {
+        "email_outbox": outbox_depth(),
+        "sheet_rows": pending_sheet_rows(),
+        "pdf_renders": pending_pdf_renders(),
+    }
+
+
+register_gauge("queue_depth", "Items waiting in each background queue.", queue_depths, label="queue")
+
+
+class RequestMetricsMiddleware:
+    # ASGI middleware recording latency per route template, so path parameters don't multiply series.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            observe("http_request_duration_seconds", time.perf_counter() - started, method=method, route=route)
+            increment("http_requests_total", method=method, route=route, status=str(status[0]))
+
+
+@router.get("/metrics")
+def metrics():
+    # Prometheus scrape endpoint.
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
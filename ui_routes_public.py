@@ -287,6 +287,10 @@ def chat():
         messagesEl.scrollTop = messagesEl.scrollHeight;
       }
 
+      const sessionId = window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+
       async function sendMessage() {
         const text = inputEl.value.trim();
         if (!text) return;
@@ -299,7 +303,7 @@ def chat():
         const resp = await fetch("/api/chat", {
           method: "POST",
           headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ messages: history })
+          body: JSON.stringify({ messages: history, session_id: sessionId })
         });
         const data = await resp.json();
         thinking.innerHTML = formatMessage(data.reply || "No response");
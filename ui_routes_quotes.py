@@ -0,0 +1,113 @@
+import os
+
+from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from artifact_store import artifact_store
+from pricing import MAX_BATCH_ITEMS, artifact_name, compute_costs_batch, fmt_money, get_defaults, parse_pct
+from email_outbox import latest_email
+from quote_jobs import pdf_status
+
+
+router = APIRouter()
+
+
+def batch_item_inputs(item, defaults):
+    # Normalize one batch line item into compute_costs inputs.
+    if not isinstance(item, dict):
+        raise ValueError("Each item must be an object")
+    try:
+        quantity = int(item.get("quantity", 0))
+    except (TypeError, ValueError):
+        raise ValueError("quantity must be an integer")
+    try:
+        labor_rate = float(item.get("labor_rate", defaults["labor_rate"]))
+        markup_pct = parse_pct(float(item.get("markup_pct", defaults["markup_pct"] * 100)))
+        vat_pct = parse_pct(float(item.get("vat_pct", defaults["vat_pct"] * 100)))
+    except (TypeError, ValueError):
+        raise ValueError("labor_rate, markup_pct and vat_pct must be numbers")
+    return {
+        "job_type": item.get("job_type"),
+        "quantity": quantity,
+        "currency": str(item.get("currency") or defaults["currency"]).upper(),
+        "labor_rate": labor_rate,
+        "markup_pct": markup_pct,
+        "vat_pct": vat_pct,
+    }
+
+
+def price_batch(items, defaults):
+    # Validate and price every line item, returning per-item results and per-currency totals.
+    inputs_list = []
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            inputs_list.append(batch_item_inputs(item, defaults))
+        except ValueError as exc:
+            errors[index] = str(exc)
+            inputs_list.append(None)
+
+    priced = iter(compute_costs_batch([i for i in inputs_list if i is not None], defaults))
+    results = []
+    totals = {}
+    for index, inputs in enumerate(inputs_list):
+        if inputs is None:
+            results.append({"index": index, "error": errors[index]})
+            continue
+        result = next(priced)
+        result["index"] = index
+        results.append(result)
+        if "summary" in result:
+            currency = result["currency"]
+            totals[currency] = totals.get(currency, 0.0) + float(result["summary"]["total"])
+    return results, totals
+
+
+@router.post("/api/quotes/batch")
+async def quotes_batch(request: Request):
+    # Price a list of line items in one request.
+    payload = await request.json()
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return JSONResponse({"ok": False, "error": "items must be a non-empty list"}, status_code=400)
+    if len(items) > MAX_BATCH_ITEMS:
+        return JSONResponse(
+            {"ok": False, "error": f"Batch is limited to {MAX_BATCH_ITEMS} items"},
+            status_code=400,
+        )
+
+    # A full batch takes long enough to price that it runs on the threadpool, not the event loop.
+    results, totals = await run_in_threadpool(price_batch, items, get_defaults())
+    return JSONResponse(
+        {
+            "ok": True,
+            "results": results,
+            "totals": {currency: fmt_money(total) for currency, total in totals.items()},
+        }
+    )
+
+
+@router.get("/api/quotes/{quote_id}/status")
+def quote_status(quote_id: str):
+    # Report the PDF render and email delivery status for a generated quote.
+    defaults = get_defaults()
+    safe_id = os.path.basename(quote_id)
+    status = pdf_status(safe_id, artifact_store(defaults["output_dir"]))
+    if status["status"] == "unknown":
+        return JSONResponse({"ok": False, "error": "Quote not found"}, status_code=404)
+    payload = {
+        "ok": True,
+        "quote_id": safe_id,
+        "pdf_status": status["status"],
+        "pdf_filename": artifact_name(safe_id, "pdf"),
+    }
+    if "error" in status:
+        payload["error"] = status["error"]
+    email = latest_email(safe_id)
+    if email is not None:
+        payload["email_status"] = email["status"]
+        payload["email_attempts"] = email["attempts"]
+        if email["last_error"]:
+            payload["email_error"] = email["last_error"]
+    return JSONResponse(payload)
@@ -0,0 +1,115 @@
+import re
+import threading
+from fractions import Fraction
+from typing import Dict, Optional, Tuple
+
+
+# Every unit is defined as an exact amount of another unit; the graph is
+# flattened into a dense factor table so conversions are one dict read.
+UNIT_DEFINITIONS: Dict[str, Tuple[str, Fraction]] = {
+    # mass
+    "g": ("kg", Fraction(1, 1000)),
+    "mg": ("g", Fraction(1, 1000)),
+    "lb": ("g", Fraction("453.59237")),
+    "oz": ("lb", Fraction(1, 16)),
+    # volume
+    "ml": ("L", Fraction(1, 1000)),
+    "cl": ("ml", Fraction(10)),
+    "tsp": ("ml", Fraction(5)),
+    "tbsp": ("tsp", Fraction(3)),
+    # counts
+    "dozen": ("each", Fraction(12)),
+    # supplier pack sizes
+    "sack_25kg": ("kg", Fraction(25)),
+    "sack_16kg": ("kg", Fraction(16)),
+    "block_250g": ("g", Fraction(250)),
+    "tray_30": ("each", Fraction(30)),
+    "case_360": ("tray_30", Fraction(12)),
+    "bottle_1L": ("L", Fraction(1)),
+}
+
+# Pack units not listed above can be named "<pack>_<amount><unit>" (sack_10kg)
+# or "<pack>_<count>" (tray_24) and are registered on first use.
+PACK_UNIT_PATTERN = re.compile(r"^[A-Za-z]+_(\d+(?:\.\d+)?)([A-Za-z]+)?$")
+
+_UNITS_LOCK = threading.Lock()
+_FACTORS: Dict[Tuple[str, str], float] = {}
+
+
+def build_factor_table(definitions: Dict[str, Tuple[str, Fraction]]) -> Dict[Tuple[str, str], float]:
+    # Resolve every unit to its root unit, then fill in the factor for each convertible pair.
+    to_root: Dict[str, Tuple[str, Fraction]] = {}
+
+    def resolve(unit: str, seen: Tuple[str, ...] = ()) -> Tuple[str, Fraction]:
+        if unit in to_root:
+            return to_root[unit]
+        if unit not in definitions:
+            to_root[unit] = (unit, Fraction(1))
+            return to_root[unit]
+        if unit in seen:
+            raise ValueError(f"Unit definitions loop through {unit}")
+        parent, amount = definitions[unit]
+        root, parent_amount = resolve(parent, seen + (unit,))
+        to_root[unit] = (root, amount * parent_amount)
+        return to_root[unit]
+
+    for unit in definitions:
+        resolve(unit)
+    factors = {}
+    for from_unit, (from_root, from_amount) in to_root.items():
+        for to_unit, (to_root_unit, to_amount) in to_root.items():
+            if from_root == to_root_unit:
+                factors[(from_unit, to_unit)] = float(from_amount / to_amount)
+    return factors
+
+
+def register_unit(name: str, defined_in: str, amount) -> None:
+    # Add a unit (e.g. a new supplier pack) and rebuild the factor table.
+    global _FACTORS
+    amount = Fraction(amount)
+    if amount <= 0:
+        raise ValueError(f"Unit {name} must be a positive amount of {defined_in}")
+    with _UNITS_LOCK:
+        # Build from a copy and swap both in only once the new table is complete.
+        definitions = dict(UNIT_DEFINITIONS)
+        definitions[name] = (defined_in, amount)
+        factors = build_factor_table(definitions)
+        UNIT_DEFINITIONS[name] = (defined_in, amount)
+        _FACTORS = factors
+
+
+def pack_unit_definition(name: str) -> Optional[Tuple[str, Fraction]]:
+    # Read the size out of a pack unit name like "sack_10kg" or "tray_24".
+    match = PACK_UNIT_PATTERN.match(name)
+    if not match:
+        return None
+    amount, unit = match.groups()
+    unit = unit or "each"
+    if Fraction(amount) <= 0:
+        return None
+    if unit not in UNIT_DEFINITIONS and all(unit != parent for parent, _ in UNIT_DEFINITIONS.values()):
+        return None
+    return unit, Fraction(amount)
+
+
+def conversion_factor(from_unit: str, to_unit: str) -> float:
+    # Multiplier that turns a quantity in from_unit into to_unit.
+    if from_unit == to_unit:
+        return 1.0
+    factor = _FACTORS.get((from_unit, to_unit))
+    if factor is not None:
+        return factor
+    added = False
+    for unit in (from_unit, to_unit):
+        if unit not in UNIT_DEFINITIONS:
+            definition = pack_unit_definition(unit)
+            if definition is not None:
+                register_unit(unit, *definition)
+                added = True
+    factor = _FACTORS.get((from_unit, to_unit)) if added else None
+    if factor is None:
+        raise ValueError(f"Cannot convert {from_unit} to {to_unit}")
+    return factor
+
+
+_FACTORS = build_factor_table(UNIT_DEFINITIONS)